@@ -1,7 +1,9 @@
+-- Topic ids are only unique within a user's model, so a group is keyed by user and id
 CREATE TABLE Groups (
     user_email_address TEXT,
-    group_id INT PRIMARY KEY,
-    name TEXT
+    group_id INT,
+    name TEXT,
+    PRIMARY KEY (user_email_address, group_id)
 );
 
 DROP TABLE IF EXISTS Emails;
@@ -16,16 +18,74 @@ CREATE TABLE Emails (
     date_sent TIMESTAMP
 );
 
+-- origin is 'model' for rows the topic server writes (and replaces on every run),
+-- 'user' for emails added to a group through the frontend
 CREATE TABLE GroupEmail (
     user_email_address TEXT,
     group_id INT,
-    email_id TEXT
+    email_id TEXT,
+    origin TEXT NOT NULL DEFAULT 'user'
 );
 
+CREATE INDEX emails_user_date_idx ON Emails (user_email_address, date_sent DESC, email_id DESC);
+CREATE INDEX emails_date_sent_brin_idx ON Emails USING brin (date_sent);
+CREATE INDEX groupemail_user_group_idx ON GroupEmail (user_email_address, group_id);
+CREATE INDEX groupemail_user_email_idx ON GroupEmail (user_email_address, email_id);
+
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- One row per (email, embedding model). text_hash is the hash of the text the
+-- vector was computed from, so the topic server only re-embeds changed emails.
 CREATE TABLE EmailEmbeddings (
-    email_id TEXT PRIMARY KEY,
+    email_id TEXT,
+    user_email_address TEXT,
+    model_name TEXT NOT NULL DEFAULT 'text-embedding-3-small',
+    text_hash TEXT,
+    embedding VECTOR,
+    PRIMARY KEY (email_id, model_name)
+);
+
+-- Fingerprint of each mailbox as of the last /topics run and the model it was
+-- assigned with; /topics returns the stored assignments while both still match.
+CREATE TABLE MailboxWatermarks (
+    user_email_address TEXT PRIMARY KEY,
+    email_count INT NOT NULL,
+    max_date_sent TIMESTAMP,
+    content_hash TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- Centroid of each of a user's topics, in the space of the embedding model the topics
+-- were fitted with. Vectors from different models differ in dimension, so each model
+-- gets its own HNSW index over a cast to its dimension; queries use the same cast.
+CREATE TABLE TopicCentroids (
+    user_email_address TEXT,
+    group_id INT,
+    model_name TEXT NOT NULL,
+    name TEXT,
+    centroid VECTOR NOT NULL,
+    PRIMARY KEY (user_email_address, group_id)
+);
+
+CREATE INDEX topiccentroids_minilm_hnsw_idx ON TopicCentroids
+    USING hnsw ((centroid::vector(384)) vector_cosine_ops)
+    WHERE model_name = 'all-MiniLM-L6-v2';
+CREATE INDEX topiccentroids_openai_small_hnsw_idx ON TopicCentroids
+    USING hnsw ((centroid::vector(1536)) vector_cosine_ops)
+    WHERE model_name = 'text-embedding-3-small';
+
+-- One row per user of each nightly batch run (topic-server/batch.py): status is
+-- pending, running, succeeded or failed; --resume picks up the rows not yet succeeded.
+CREATE TABLE TopicBatchProgress (
+    run_id TEXT,
     user_email_address TEXT,
-    embedding VECTOR(1536)
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    email_count INT,
+    error TEXT,
+    seconds DOUBLE PRECISION,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    PRIMARY KEY (run_id, user_email_address)
 );
@@ -34,7 +34,7 @@ export async function createEmailGroups(userEmail: string) {
 export async function getUserGroups(userEmail: string, accessToken: string) {
   try {
     const query =
-      'select Groups.group_id, Groups.name, GroupEmail.email_id from Groups join GroupEmail on Groups.group_id = GroupEmail.group_id where Groups.user_email_address = $1';
+      'select Groups.group_id, Groups.name, GroupEmail.email_id from Groups join GroupEmail on Groups.user_email_address = GroupEmail.user_email_address and Groups.group_id = GroupEmail.group_id where Groups.user_email_address = $1';
     const { rows } = await client.query(query, [userEmail]);
 
     const emailIds = Array.from(
@@ -0,0 +1,12 @@
+-- Let EmailEmbeddings double as the topic server's embedding cache.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/001_email_embedding_cache.sql
+
+ALTER TABLE EmailEmbeddings ADD COLUMN IF NOT EXISTS model_name TEXT NOT NULL DEFAULT 'text-embedding-3-small';
+ALTER TABLE EmailEmbeddings ADD COLUMN IF NOT EXISTS text_hash TEXT;
+
+-- Local sentence-transformers are not 1536-dimensional.
+ALTER TABLE EmailEmbeddings ALTER COLUMN embedding TYPE VECTOR;
+
+ALTER TABLE EmailEmbeddings DROP CONSTRAINT IF EXISTS emailembeddings_pkey;
+ALTER TABLE EmailEmbeddings ADD PRIMARY KEY (email_id, model_name);
@@ -0,0 +1,28 @@
+-- Indexes behind /topics_by_timeframe and the per-user mailbox scans.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/002_timeframe_indexes.sql
+--
+-- To check the plan uses them (expect Index Scan / Bitmap Index Scan on
+-- emails_user_date_idx and groupemail_user_email_idx, not Seq Scan on Emails/GroupEmail):
+--   EXPLAIN (ANALYZE, BUFFERS)
+--   SELECT ge.group_id, g.name, ge.email_id
+--   FROM Emails e
+--   JOIN GroupEmail ge ON ge.email_id = e.email_id AND ge.user_email_address = e.user_email_address
+--   JOIN Groups g ON g.user_email_address = ge.user_email_address AND g.group_id = ge.group_id
+--   WHERE ge.user_email_address = 'someone@example.com'
+--     AND e.user_email_address = 'someone@example.com'
+--     AND e.date_sent >= now() - interval '90 days'
+--   ORDER BY e.date_sent DESC, e.email_id DESC, ge.group_id DESC;
+
+-- Range scans of one user's mailbox by date (timeframe filter, fetch_user_emails ordering)
+CREATE INDEX IF NOT EXISTS emails_user_date_idx ON Emails (user_email_address, date_sent DESC, email_id DESC);
+
+-- Mail is mostly inserted in date order, so a BRIN index prunes date ranges across all users cheaply
+CREATE INDEX IF NOT EXISTS emails_date_sent_brin_idx ON Emails USING brin (date_sent);
+
+-- Per-user group membership lookups, and the join from a user's Emails rows to their groups
+CREATE INDEX IF NOT EXISTS groupemail_user_group_idx ON GroupEmail (user_email_address, group_id);
+CREATE INDEX IF NOT EXISTS groupemail_user_email_idx ON GroupEmail (user_email_address, email_id);
+
+ANALYZE Emails;
+ANALYZE GroupEmail;
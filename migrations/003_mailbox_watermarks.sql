@@ -0,0 +1,12 @@
+-- Mailbox watermarks that let /topics skip recomputation for unchanged mailboxes.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/003_mailbox_watermarks.sql
+
+CREATE TABLE IF NOT EXISTS MailboxWatermarks (
+    user_email_address TEXT PRIMARY KEY,
+    email_count INT NOT NULL,
+    max_date_sent TIMESTAMP,
+    content_hash TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,25 @@
+-- Topic centroids behind /assign_topics. Needs pgvector 0.5+ for HNSW; iterative index scans are used on 0.8+.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/004_topic_centroids.sql
+--
+-- A model other than these two needs its own index, e.g. for a 768-dimensional model:
+--   CREATE INDEX ON TopicCentroids USING hnsw ((centroid::vector(768)) vector_cosine_ops) WHERE model_name = '<model>';
+
+CREATE TABLE IF NOT EXISTS TopicCentroids (
+    user_email_address TEXT,
+    group_id INT,
+    model_name TEXT NOT NULL,
+    centroid VECTOR NOT NULL,
+    PRIMARY KEY (user_email_address, group_id)
+);
+
+CREATE INDEX IF NOT EXISTS topiccentroids_minilm_hnsw_idx ON TopicCentroids
+    USING hnsw ((centroid::vector(384)) vector_cosine_ops)
+    WHERE model_name = 'all-MiniLM-L6-v2';
+CREATE INDEX IF NOT EXISTS topiccentroids_openai_small_hnsw_idx ON TopicCentroids
+    USING hnsw ((centroid::vector(1536)) vector_cosine_ops)
+    WHERE model_name = 'text-embedding-3-small';
+
+-- Centroids are written by /topics; forget the watermarks so unchanged mailboxes
+-- still run once and populate them
+DELETE FROM MailboxWatermarks;
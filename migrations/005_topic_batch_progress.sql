@@ -0,0 +1,16 @@
+-- Progress of the batch re-clustering CLI (topic-server/batch.py), for --resume.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/005_topic_batch_progress.sql
+
+CREATE TABLE IF NOT EXISTS TopicBatchProgress (
+    run_id TEXT,
+    user_email_address TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    email_count INT,
+    error TEXT,
+    seconds DOUBLE PRECISION,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    PRIMARY KEY (run_id, user_email_address)
+);
@@ -0,0 +1,27 @@
+-- Key Groups by (user, group_id): topic ids come from each user's own model, so with a
+-- global group_id one user's /topics run renamed another user's groups with the same ids.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/006_groups_per_user.sql
+
+BEGIN;
+
+-- Rows without an owner can't be part of the new key and no query reads them
+DELETE FROM Groups WHERE user_email_address IS NULL;
+ALTER TABLE Groups DROP CONSTRAINT IF EXISTS groups_pkey;
+ALTER TABLE Groups ADD PRIMARY KEY (user_email_address, group_id);
+
+-- Earlier stores appended a copy of every assignment; keep one row of each
+DELETE FROM GroupEmail a
+USING GroupEmail b
+WHERE a.ctid < b.ctid
+  AND a.user_email_address IS NOT DISTINCT FROM b.user_email_address
+  AND a.group_id IS NOT DISTINCT FROM b.group_id
+  AND a.email_id IS NOT DISTINCT FROM b.email_id;
+
+-- Group names may have been overwritten by another user's run; have the next /topics store them again
+DELETE FROM MailboxWatermarks;
+
+COMMIT;
+
+ANALYZE Groups;
+ANALYZE GroupEmail;
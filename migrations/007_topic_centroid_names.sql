@@ -0,0 +1,9 @@
+-- Keep each centroid's topic name in TopicCentroids, so /assign_topics labels mail with
+-- the name from the model the centroid came from rather than whatever Groups holds.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/007_topic_centroid_names.sql
+
+ALTER TABLE TopicCentroids ADD COLUMN IF NOT EXISTS name TEXT;
+
+-- Centroids are written by /topics; forget the watermarks so the next run stores the names
+DELETE FROM MailboxWatermarks;
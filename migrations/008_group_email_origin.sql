@@ -0,0 +1,14 @@
+-- Record who wrote each GroupEmail row. The topic server replaces only the rows it wrote
+-- ('model'), so emails the frontend adds to groups ('user', the column default) survive
+-- /topics, /topics_incremental and batch runs.
+-- Apply to databases created from an older init.sql:
+--   psql -h localhost -p 6543 -U postgres -d clustermail -f migrations/008_group_email_origin.sql
+
+BEGIN;
+
+-- Existing rows can't be told apart; nearly all of them were written by the topic server,
+-- so they are marked as its rows (its next run replaces them)
+ALTER TABLE GroupEmail ADD COLUMN IF NOT EXISTS origin TEXT NOT NULL DEFAULT 'model';
+ALTER TABLE GroupEmail ALTER COLUMN origin SET DEFAULT 'user';
+
+COMMIT;
@@ -0,0 +1,75 @@
+import json
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import APIRouter, FastAPI, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from db import (
+    RowStream,
+    close_read_pool,
+    fetch_recent_emails,
+    fetch_topics_by_timeframe,
+    stream_recent_emails,
+    stream_topics_by_timeframe
+)
+from metrics import router as metrics_router
+from metrics import trace_requests
+
+# Read-only endpoints. This module must not import the modeling stack
+# (bertopic, umap, hdbscan, sentence-transformers, sklearn), so `fastapi run api.py`
+# starts fast and stays small enough to scale out horizontally.
+router = APIRouter()
+
+# Largest page a client can ask for in the paged JSON mode
+MAX_PAGE_SIZE = 5000
+
+def ndjson_response(items: RowStream) -> StreamingResponse:
+    """
+    Stream rows of dicts as newline-delimited JSON, one row per line. The stream is closed
+    after the response, however it ended, so its connection always goes back to the pool.
+    """
+    async def lines():
+        async for item in items:
+            yield json.dumps(item) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson", background=BackgroundTask(items.close))
+
+@router.get("/")
+def read_root():
+    return {"Hello": "World"}
+
+@router.get("/recent_emails")
+async def get_recent_emails(
+    user_email: str = Query(..., description="User's email address"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (default 50); with format=ndjson, rows to stream (default all)"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json for one page, ndjson to stream every row")
+):
+    """Get a user's emails newest first, one page at a time or streamed as NDJSON."""
+    if format == "ndjson":
+        return ndjson_response(await stream_recent_emails(user_email, cursor, limit))
+    return await fetch_recent_emails(user_email, limit or 50, cursor)
+
+@router.get("/topics_by_timeframe")
+async def get_topics_by_timeframe(
+    user_email: str = Query(...),
+    timeframe: str = Query(..., description="Choose from: 1_month, 3_months, 1_year, 5_years, all_time"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (default 500); with format=ndjson, rows to stream (default all)"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json for one page, ndjson to stream every row")
+):
+    """Get topics and corresponding emails from a given timeframe, one page at a time or streamed as NDJSON."""
+    if format == "ndjson":
+        return ndjson_response(await stream_topics_by_timeframe(user_email, timeframe, cursor, limit))
+    return await fetch_topics_by_timeframe(user_email, timeframe, limit or 500, cursor)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_read_pool()
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(trace_requests)
+app.include_router(router)
+app.include_router(metrics_router)
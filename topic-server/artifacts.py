@@ -0,0 +1,289 @@
+import json
+import os
+import uuid
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags
+
+# Directory holding one slim artifact per user (and per user and window)
+MODEL_DIR = os.environ.get("TOPIC_MODEL_DIR", "models")
+
+MANIFEST_FILE = "topics.json"
+ARRAY_FILES = (
+    "topic_embeddings",
+    "ctfidf_data", "ctfidf_indices", "ctfidf_indptr",
+    "counts_data", "counts_indices", "counts_indptr"
+)
+
+def artifact_path(user_email: str, window: str = None) -> str:
+    """Directory of the artifact for a user's mailbox, or for one of its time windows."""
+    name = user_email if window is None else f"{user_email}_{window}"
+    return os.path.join(MODEL_DIR, name)
+
+def artifact_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+def artifact_stamp(path: str) -> str:
+    """
+    Identifies the current version of an artifact from its manifest's inode and mtime,
+    without reading it ("-" if there is none). Every write swaps in a new manifest file.
+    """
+    try:
+        stat = os.stat(os.path.join(path, MANIFEST_FILE))
+    except FileNotFoundError:
+        return "-"
+    return f"{stat.st_ino}.{stat.st_mtime_ns}"
+
+def _array_files(manifest: dict) -> dict:
+    """Array name -> file name for an artifact; artifacts written before versioned files use <name>.npy."""
+    return manifest.get("array_files") or {name: f"{name}.npy" for name in ARRAY_FILES}
+
+def _read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def _write_artifact(path: str, arrays: dict, manifest: dict):
+    """
+    Write a new version of an artifact. The arrays go to files named after the version,
+    then the manifest, which names those files, is swapped in with one rename. Readers
+    open the arrays the manifest they read names, so they get the old version or the new
+    one, never a mix. The previous version's files are kept for readers that read its
+    manifest just before the swap; older ones are removed (memory-mapped copies stay valid).
+    """
+    os.makedirs(path, exist_ok=True)
+    previous = _read_manifest(path) if artifact_exists(path) else None
+    version = uuid.uuid4().hex
+    files = {name: f"{name}.{version}.npy" for name in arrays}
+    for name, array in arrays.items():
+        np.save(os.path.join(path, files[name]), array)
+
+    manifest = {**manifest, "version": version, "array_files": files}
+    tmp_file = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, os.path.join(path, MANIFEST_FILE))
+
+    keep = set(files.values()) | (set(_array_files(previous).values()) if previous else set())
+    for entry in os.scandir(path):
+        if entry.name.endswith(".npy") and entry.name not in keep:
+            os.remove(entry.path)
+
+def _csr_arrays(prefix: str, matrix) -> dict:
+    matrix = csr_matrix(matrix)
+    return {
+        f"{prefix}_data": matrix.data.astype(np.float32),
+        f"{prefix}_indices": matrix.indices,
+        f"{prefix}_indptr": matrix.indptr
+    }
+
+def save_artifact(topic_model, path: str, embedding_model_name: str, documents: list, topics: list):
+    """
+    Save only what is needed to assign and name topics: the topic centroids,
+    the c-TF-IDF matrix, per-topic term counts (for online updates) and the topic
+    labels. Arrays are written as plain .npy files so they can be memory-mapped;
+    the embedding model is not included.
+    """
+    offset = int(topic_model._outliers)
+    topic_info = topic_model.get_topic_info().sort_values("Topic")
+    n_rows = len(topic_info)
+
+    # Per-topic term counts over the fitted documents, one row per topic like c_tf_idf_
+    doc_term_counts = topic_model.vectorizer_model.transform(documents)
+    rows = np.asarray(topics) + offset
+    membership = csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(n_rows, len(rows)))
+    term_counts = membership @ doc_term_counts
+
+    arrays = {
+        "topic_embeddings": np.asarray(topic_model.topic_embeddings_, dtype=np.float32),
+        **_csr_arrays("ctfidf", topic_model.c_tf_idf_),
+        **_csr_arrays("counts", term_counts)
+    }
+    manifest = {
+        "embedding_model": embedding_model_name,
+        # Row i of topic_embeddings / c_tf_idf / counts belongs to topic i - outlier_offset
+        "outlier_offset": offset,
+        "ctfidf_shape": [n_rows, term_counts.shape[1]],
+        "vocabulary": topic_model.vectorizer_model.get_feature_names_out().tolist(),
+        "topics": {
+            "Topic": topic_info["Topic"].astype(int).tolist(),
+            "Count": topic_info["Count"].astype(int).tolist(),
+            "Name": topic_info["Name"].tolist(),
+            "Representation": topic_info["Representation"].tolist()
+        },
+        # Online-update bookkeeping, reset on every full fit
+        "fit_doc_count": len(documents),
+        "docs_since_fit": 0,
+        "outliers_since_fit": 0
+    }
+    _write_artifact(path, arrays, manifest)
+
+def load_artifact(path: str) -> dict:
+    """
+    Open an artifact with its arrays memory-mapped read-only. If two writes land between
+    reading the manifest and opening its arrays, the files are gone and the read is retried.
+    """
+    for attempt in range(3):
+        manifest = _read_manifest(path)
+        files = _array_files(manifest)
+        try:
+            arrays = {name: np.load(os.path.join(path, files[name]), mmap_mode="r") for name in ARRAY_FILES}
+            break
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+    topic_embeddings = arrays["topic_embeddings"]
+    norms = np.linalg.norm(topic_embeddings, axis=1, keepdims=True)
+    offset = manifest["outlier_offset"]
+    shape = tuple(manifest["ctfidf_shape"])
+    return {
+        "manifest": manifest,
+        "version": manifest["version"],
+        "embedding_model": manifest["embedding_model"],
+        "outlier_offset": offset,
+        "topic_embeddings": topic_embeddings,
+        # Normalized centroids of the real topics, for cosine-similarity assignment
+        "centroids": topic_embeddings[offset:] / np.where(norms[offset:] == 0, 1, norms[offset:]),
+        "c_tf_idf": csr_matrix((arrays["ctfidf_data"], arrays["ctfidf_indices"], arrays["ctfidf_indptr"]), shape=shape),
+        "term_counts": csr_matrix((arrays["counts_data"], arrays["counts_indices"], arrays["counts_indptr"]), shape=shape),
+        "vocabulary": manifest["vocabulary"],
+        "topic_info": pd.DataFrame(manifest["topics"])
+    }
+
+def topic_similarities(artifact: dict, embeddings: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each document to each (non-outlier) topic centroid."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.where(norms == 0, 1, norms)) @ artifact["centroids"].T
+
+def assign_topics(artifact: dict, embeddings: np.ndarray, min_similarity: Optional[float] = None) -> np.ndarray:
+    """
+    Assign each document to the topic with the most similar centroid (cosine similarity),
+    or to the outlier topic (-1) when no centroid reaches min_similarity.
+    """
+    if len(artifact["centroids"]) == 0:
+        return np.full(len(embeddings), -1)
+    similarity = topic_similarities(artifact, embeddings)
+    topics = np.argmax(similarity, axis=1)
+    if min_similarity is not None:
+        topics[similarity.max(axis=1) < min_similarity] = -1
+    return topics
+
+def _ctfidf(term_counts: csr_matrix) -> csr_matrix:
+    """c-TF-IDF as BERTopic computes it: L1-normalized class term frequencies times log(1 + A / df)."""
+    from sklearn.preprocessing import normalize
+    df = np.asarray(term_counts.sum(axis=0)).ravel()
+    avg_nr_samples = int(term_counts.sum(axis=1).mean())
+    idf = np.log((avg_nr_samples / np.where(df == 0, 1, df)) + 1)
+    return csr_matrix(normalize(term_counts, axis=1, norm="l1") @ diags(idf))
+
+def document_term_counts(artifact: dict, documents: list) -> csr_matrix:
+    """Term counts of each document over the artifact's vocabulary (words outside it are ignored)."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    return csr_matrix(CountVectorizer(vocabulary=artifact["vocabulary"]).transform(documents))
+
+def _representations(artifact: dict, c_tf_idf: csr_matrix):
+    """Top words and BERTopic-style names ("<id>_w1_w2_w3_w4") for each topic row of c_tf_idf."""
+    vocabulary = np.array(artifact["vocabulary"], dtype=object)
+    representations, names = [], []
+    for row, topic_id in enumerate(artifact["topic_info"]["Topic"]):
+        weights = c_tf_idf.getrow(row).toarray().ravel()
+        order = np.argsort(weights)[::-1][:10]
+        top_words = vocabulary[order[weights[order] > 0]].tolist()
+        representations.append(top_words)
+        names.append(f"{topic_id}_" + "_".join(top_words[:4]))
+    return representations, names
+
+def update_artifact(path: str, artifact: dict, embeddings: np.ndarray, documents: list, min_similarity: float) -> np.ndarray:
+    """
+    Fold new documents into a saved artifact without refitting.
+    Each document goes to its nearest centroid, or to the outlier topic (-1) when no
+    centroid reaches min_similarity. Centroids move to the running mean of their
+    members, term counts grow by the new documents' counts (words outside the fitted
+    vocabulary are ignored), and c-TF-IDF, representations and names are recomputed.
+    Returns the assigned topic ids.
+    """
+    manifest = artifact["manifest"]
+    offset = artifact["outlier_offset"]
+    topic_info = artifact["topic_info"]
+
+    # Documents close to no topic join the outlier topic, if the artifact has one
+    topics = assign_topics(artifact, embeddings, min_similarity if offset else None)
+    rows = topics + offset
+
+    counts = np.array(topic_info["Count"], dtype=np.int64)
+    topic_embeddings = np.array(artifact["topic_embeddings"], dtype=np.float64)
+    for row in np.unique(rows):
+        members = embeddings[rows == row]
+        topic_embeddings[row] = (topic_embeddings[row] * counts[row] + members.sum(axis=0)) / (counts[row] + len(members))
+        counts[row] += len(members)
+
+    membership = csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(len(counts), len(rows)))
+    term_counts = artifact["term_counts"] + membership @ document_term_counts(artifact, documents)
+    c_tf_idf = _ctfidf(term_counts)
+    representations, names = _representations(artifact, c_tf_idf)
+
+    arrays = {
+        "topic_embeddings": topic_embeddings.astype(np.float32),
+        **_csr_arrays("ctfidf", c_tf_idf),
+        **_csr_arrays("counts", term_counts)
+    }
+    _write_artifact(path, arrays, {
+        **manifest,
+        "topics": {
+            "Topic": topic_info["Topic"].astype(int).tolist(),
+            "Count": counts.tolist(),
+            "Name": names,
+            "Representation": representations
+        },
+        "docs_since_fit": manifest["docs_since_fit"] + len(documents),
+        "outliers_since_fit": manifest["outliers_since_fit"] + int((topics == -1).sum())
+    })
+    return topics
+
+def slice_artifact(path: str, artifact: dict, topics: np.ndarray, doc_term_counts: csr_matrix, embeddings: np.ndarray) -> pd.DataFrame:
+    """
+    Save an artifact for a subset of the documents a parent artifact was fit on, keeping
+    the parent's topics (and topic ids) instead of fitting a new model.
+    topics, doc_term_counts and embeddings are the subset's rows. Counts, c-TF-IDF,
+    representations and names are recomputed from the subset alone; centroids move to the
+    mean of the subset's members, and topics with no member in it keep the parent's.
+    Returns the subset's topic info, without the topics that have no member in it.
+    """
+    offset = artifact["outlier_offset"]
+    topic_info = artifact["topic_info"]
+    rows = np.asarray(topics, dtype=np.int64) + offset
+    n_rows = len(topic_info)
+
+    membership = csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(n_rows, len(rows)))
+    counts = np.bincount(rows, minlength=n_rows)
+    topic_embeddings = np.array(artifact["topic_embeddings"], dtype=np.float64)
+    present = counts > 0
+    topic_embeddings[present] = (membership @ embeddings)[present] / counts[present, None]
+
+    term_counts = csr_matrix(membership @ doc_term_counts)
+    c_tf_idf = _ctfidf(term_counts)
+    representations, names = _representations(artifact, c_tf_idf)
+
+    topics_manifest = {
+        "Topic": topic_info["Topic"].astype(int).tolist(),
+        "Count": counts.tolist(),
+        "Name": names,
+        "Representation": representations
+    }
+    arrays = {
+        "topic_embeddings": topic_embeddings.astype(np.float32),
+        **_csr_arrays("ctfidf", c_tf_idf),
+        **_csr_arrays("counts", term_counts)
+    }
+    _write_artifact(path, arrays, {
+        **artifact["manifest"],
+        "topics": topics_manifest,
+        "parent_version": artifact["version"],
+        "fit_doc_count": len(rows),
+        "docs_since_fit": 0,
+        "outliers_since_fit": 0
+    })
+    slice_info = pd.DataFrame(topics_manifest)
+    return slice_info[present].reset_index(drop=True)
@@ -0,0 +1,260 @@
+"""
+Batch re-clustering of every mailbox, for off-peak refreshes.
+
+Lists the users in Emails (largest mailboxes first) and runs the /topics pipeline for
+each of them on a pool of worker processes. Every user gets a wall-time and a
+peak-memory limit; a worker over either is killed and replaced, and the user is marked
+failed. Progress is recorded per user in TopicBatchProgress, so an interrupted run can
+be resumed where it stopped.
+
+Run from topic-server/ with the database from docker-compose up:
+
+    python batch.py --workers 8 --timeout 1800 --memory-limit 8192
+    python batch.py --resume 20250101-020000 --retry-failed
+
+Mailboxes that changed since their last /topics run are refit; unchanged ones are
+skipped through their watermark unless --refit is given.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing.connection import wait
+from typing import List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from compute import CORE_BUDGET
+from db import get_db_connection, release_db_connection
+
+# Seconds between checks of the running users' time and memory
+POLL_SECONDS = 1.0
+
+def list_users(cur, min_emails: int) -> List[Tuple[str, int]]:
+    """(user, email count) for every user with at least min_emails emails, largest mailbox first."""
+    cur.execute(
+        """
+        SELECT user_email_address, count(*)
+        FROM Emails
+        WHERE user_email_address IS NOT NULL
+        GROUP BY user_email_address
+        HAVING count(*) >= %s
+        ORDER BY count(*) DESC
+        """,
+        (min_emails,)
+    )
+    return cur.fetchall()
+
+def start_run(cur, run_id: str, users: List[Tuple[str, int]]):
+    execute_values(
+        cur,
+        """
+        INSERT INTO TopicBatchProgress (run_id, user_email_address, email_count)
+        VALUES %s
+        ON CONFLICT (run_id, user_email_address) DO NOTHING
+        """,
+        [(run_id, user_email, email_count) for user_email, email_count in users]
+    )
+
+def remaining_users(cur, run_id: str, retry_failed: bool) -> List[Tuple[str, int]]:
+    """Users of a run still to do: pending, running when the run stopped, and (optionally) failed."""
+    statuses = ["pending", "running"] + (["failed"] if retry_failed else [])
+    cur.execute(
+        """
+        SELECT user_email_address, email_count
+        FROM TopicBatchProgress
+        WHERE run_id = %s AND status = ANY(%s)
+        ORDER BY email_count DESC NULLS LAST
+        """,
+        (run_id, statuses)
+    )
+    return cur.fetchall()
+
+def mark_user(conn, run_id: str, user_email: str, status: str, error: Optional[str] = None, seconds: Optional[float] = None):
+    cur = conn.cursor()
+    if status == "running":
+        cur.execute(
+            """
+            UPDATE TopicBatchProgress
+            SET status = 'running', attempts = attempts + 1, error = NULL, started_at = now(), finished_at = NULL
+            WHERE run_id = %s AND user_email_address = %s
+            """,
+            (run_id, user_email)
+        )
+    else:
+        cur.execute(
+            """
+            UPDATE TopicBatchProgress
+            SET status = %s, error = %s, seconds = %s, finished_at = now()
+            WHERE run_id = %s AND user_email_address = %s
+            """,
+            (status, error, seconds, run_id, user_email)
+        )
+    conn.commit()
+
+def _rss_bytes(pid: int) -> int:
+    """Resident set size of a process, from /proc (0 where that isn't available)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _worker_main(conn, refit: bool, threads: int):
+    """
+    Worker process: load the modeling stack once, then run /topics for each user sent down
+    conn, with `threads` threads (its share of the core budget).
+    """
+    from fastapi import HTTPException
+    from compute import limit_process_threads, thread_allotment
+    from pipeline import compute_topics, preload_modeling
+
+    logging.basicConfig(level=os.environ.get("TOPIC_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    preload_modeling()
+    limit_process_threads(threads)
+    conn.send(("ready",))
+    while True:
+        user_email = conn.recv()
+        if user_email is None:
+            return
+        start = time.perf_counter()
+        try:
+            with thread_allotment(threads):
+                compute_topics(user_email, refit=refit, reuse_artifact=False)
+            conn.send(("done", "succeeded", None, time.perf_counter() - start))
+        except HTTPException as e:
+            conn.send(("done", "failed", f"{e.status_code}: {e.detail}", time.perf_counter() - start))
+        except Exception as e:
+            conn.send(("done", "failed", f"{type(e).__name__}: {e}", time.perf_counter() - start))
+
+class Worker:
+    """One worker process, with the pipe it receives users on and reports back through."""
+    def __init__(self, context, refit: bool, threads: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, refit, threads), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.user_email = None
+        self.started_at = None
+
+    def assign(self, user_email: str):
+        self.conn.send(user_email)
+        self.user_email = user_email
+        self.started_at = time.monotonic()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+def run_batch(run_id: str, users: deque, workers: int, timeout: float, memory_limit: int, refit: bool) -> dict:
+    """Process users on `workers` worker processes, recording each outcome in TopicBatchProgress."""
+    # Spawned, not forked, like the model fit pool: workers must not inherit torch/OpenMP state
+    context = multiprocessing.get_context("spawn")
+    conn = get_db_connection()
+    # The workers split the core budget, so together they don't oversubscribe the machine
+    threads = max(1, CORE_BUDGET // workers)
+    pool = [Worker(context, refit, threads) for _ in range(min(workers, len(users)))]
+    counts = {"succeeded": 0, "failed": 0}
+
+    def finish(worker: Worker, status: str, error: Optional[str], seconds: float):
+        print(f"{worker.user_email}: {status} in {seconds:.1f}s" + (f" ({error})" if error else ""))
+        mark_user(conn, run_id, worker.user_email, status, error, seconds)
+        counts[status] += 1
+        worker.user_email = None
+
+    def replace(worker: Worker) -> Worker:
+        worker.kill()
+        return Worker(context, refit, threads)
+
+    try:
+        while users or any(worker.user_email for worker in pool):
+            for worker in pool:
+                if worker.ready and worker.user_email is None and users:
+                    user_email, email_count = users.popleft()
+                    print(f"{user_email}: starting ({email_count} emails)")
+                    mark_user(conn, run_id, user_email, "running")
+                    worker.assign(user_email)
+
+            for ready_conn in wait([worker.conn for worker in pool], timeout=POLL_SECONDS):
+                i = next(i for i, worker in enumerate(pool) if worker.conn is ready_conn)
+                worker = pool[i]
+                try:
+                    message = worker.conn.recv()
+                except EOFError:
+                    # The process died: killed by the OS (e.g. out of memory) or crashed
+                    if worker.user_email is None:
+                        raise RuntimeError(f"Batch worker exited with code {worker.process.exitcode} before taking work")
+                    finish(worker, "failed", f"worker exited with code {worker.process.exitcode}", time.monotonic() - worker.started_at)
+                    pool[i] = replace(worker)
+                    continue
+                if message[0] == "ready":
+                    worker.ready = True
+                else:
+                    _, status, error, seconds = message
+                    finish(worker, status, error, seconds)
+
+            now = time.monotonic()
+            for i, worker in enumerate(pool):
+                if worker.user_email is None:
+                    continue
+                elapsed = now - worker.started_at
+                if timeout and elapsed > timeout:
+                    finish(worker, "failed", f"timed out after {timeout:.0f}s", elapsed)
+                    pool[i] = replace(worker)
+                elif memory_limit and _rss_bytes(worker.process.pid) > memory_limit:
+                    finish(worker, "failed", f"exceeded the memory limit of {memory_limit // 2 ** 20} MiB", elapsed)
+                    pool[i] = replace(worker)
+    finally:
+        for worker in pool:
+            if worker.process.is_alive() and worker.user_email is None:
+                try:
+                    worker.conn.send(None)
+                    worker.process.join(timeout=5)
+                except OSError:
+                    pass
+            if worker.process.is_alive():
+                worker.kill()
+        release_db_connection(conn)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute topics for every user on a pool of worker processes.")
+    parser.add_argument("--workers", type=int, default=max(1, CORE_BUDGET // 2), help="Worker processes (default half the core budget; they share it)")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds one user may take before its worker is killed (0 = no limit)")
+    parser.add_argument("--memory-limit", type=int, default=0, help="MiB of RSS one worker may use before it is killed (0 = no limit)")
+    parser.add_argument("--min-emails", type=int, default=1, help="Skip users with fewer emails")
+    parser.add_argument("--users", help="Comma-separated users to process instead of everyone in Emails")
+    parser.add_argument("--refit", action="store_true", help="Refit every model, even for unchanged mailboxes")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue an interrupted run instead of starting a new one")
+    parser.add_argument("--retry-failed", action="store_true", help="With --resume, also rerun the users that failed")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        if args.resume:
+            run_id = args.resume
+        else:
+            run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+            users = list_users(cur, args.min_emails)
+            if args.users:
+                wanted = set(args.users.split(","))
+                users = [user for user in users if user[0] in wanted]
+            start_run(cur, run_id, users)
+        users = deque(remaining_users(cur, run_id, args.retry_failed))
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+    print(f"Batch run {run_id}: {len(users)} users on {args.workers} workers")
+    start = time.perf_counter()
+    counts = run_batch(run_id, users, args.workers, args.timeout, args.memory_limit * 2 ** 20, args.refit) if users else {}
+    print(f"Batch run {run_id} finished in {time.perf_counter() - start:.0f}s: {counts}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare the topic backends (modeling.BACKENDS) on the same corpus.
+
+Each backend is fit on identical documents and embeddings; the report gives wall
+time, topic count, outlier rate, NPMI topic coherence and agreement (ARI / NMI)
+with the first backend listed.
+
+Run from topic-server/:
+
+    python -m benchmarks.compare_backends --user-email someone@example.com
+    python -m benchmarks.compare_backends --texts corpus.txt --backends quality,fast --output backends.json
+"""
+import argparse
+import json
+import time
+from itertools import combinations
+from typing import Dict, List
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+
+from modeling import BACKENDS, TOPICS_CONFIG, build_topic_model
+
+def npmi_coherence(documents: List[str], topic_words: List[List[str]]) -> float:
+    """
+    Mean NPMI over pairs of each topic's top words, with probabilities taken from
+    document co-occurrence in the corpus itself. Ranges from -1 to 1; higher is more coherent.
+    """
+    vocabulary = sorted({word for words in topic_words for word in words})
+    if not vocabulary:
+        return 0.0
+    index = {word: i for i, word in enumerate(vocabulary)}
+    occurs = CountVectorizer(vocabulary=vocabulary, binary=True).transform(documents).tocsc().astype(np.float64)
+    n_docs = occurs.shape[0]
+    doc_freq = np.asarray(occurs.sum(axis=0)).ravel() / n_docs
+    co_freq = (occurs.T @ occurs).toarray() / n_docs
+
+    scores = []
+    for words in topic_words:
+        pairs = []
+        for a, b in combinations([index[word] for word in words], 2):
+            p_ab = co_freq[a, b]
+            if p_ab == 0:
+                pairs.append(-1.0)
+            elif p_ab == 1:
+                pairs.append(1.0)
+            else:
+                pairs.append(np.log(p_ab / (doc_freq[a] * doc_freq[b])) / -np.log(p_ab))
+        if pairs:
+            scores.append(np.mean(pairs))
+    return float(np.mean(scores)) if scores else 0.0
+
+def run_backend(backend: str, documents: List[str], embeddings: np.ndarray) -> Dict:
+    config = {**TOPICS_CONFIG, "backend": backend}
+    topic_model = build_topic_model(config, n_documents=len(documents))
+    start = time.perf_counter()
+    topics, _ = topic_model.fit_transform(documents, embeddings)
+    fit_seconds = time.perf_counter() - start
+
+    topics = np.asarray(topics)
+    topic_ids = sorted(set(topics.tolist()) - {-1})
+    topic_words = [[word for word, _ in topic_model.get_topic(tid)[:10] if word] for tid in topic_ids]
+    return {
+        "backend": backend,
+        "fit_seconds": round(fit_seconds, 3),
+        "n_topics": len(topic_ids),
+        "outlier_rate": round(float((topics == -1).mean()), 4),
+        "coherence_npmi": round(npmi_coherence(documents, topic_words), 4),
+        "topics": topics
+    }
+
+def load_corpus(args):
+    """Documents and embeddings for the comparison: a user's mailbox, or a text file embedded locally."""
+    if args.user_email:
+        from pipeline import fetch_user_emails, load_embeddings
+        emails = fetch_user_emails(args.user_email)
+        documents = emails["email_text"].tolist()
+        embeddings, _, missing = load_embeddings(args.user_email, emails["email_id"].tolist(), documents)
+        # Emails without a stored vector (EMBEDDING_SOURCE=stored) are left out, as in /topics
+        emails = {name: column[~missing] for name, column in emails.items()}
+        documents = emails["email_text"].tolist()
+        return documents, embeddings
+    from embeddings import get_embedding_model
+    with open(args.texts) as f:
+        documents = [line.strip() for line in f if line.strip()]
+    return documents, get_embedding_model().encode(documents, show_progress_bar=False).astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare topic backends on one corpus.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--user-email", help="Use this user's mailbox from Postgres")
+    source.add_argument("--texts", help="Use a file with one document per line")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated backends; the first is the agreement reference")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    documents, embeddings = load_corpus(args)
+    print(f"Comparing backends on {len(documents)} documents")
+
+    results = [run_backend(backend, documents, embeddings) for backend in args.backends.split(",")]
+    reference = results[0]["topics"]
+    for result in results:
+        topics = result.pop("topics")
+        result["ari_vs_reference"] = round(adjusted_rand_score(reference, topics), 4)
+        result["nmi_vs_reference"] = round(normalized_mutual_info_score(reference, topics), 4)
+        print(f"{result['backend']}: {result['fit_seconds']}s, {result['n_topics']} topics, coherence {result['coherence_npmi']}")
+
+    report = {"n_documents": len(documents), "reference": results[0]["backend"], "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
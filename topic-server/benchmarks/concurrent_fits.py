@@ -0,0 +1,105 @@
+"""
+Measure /topics fit throughput under concurrent load, with and without the core budget.
+
+--concurrency fits of synthetic mailboxes run at once on a thread pool, as the job pool
+runs them. "unbudgeted" leaves UMAP, HDBSCAN, BLAS and torch at their own defaults (each
+fit sizes its pools to the whole machine); "budgeted" gives each fit its allotment of
+TOPIC_CORE_BUDGET the way jobs.py does. Each mode runs in a fresh process, since the
+BLAS and torch limits are process-wide. The report gives fits per minute for each mode
+and, for reference, a single fit with the whole budget.
+
+Run from topic-server/:
+
+    python -m benchmarks.concurrent_fits --size 5000 --concurrency 4 --fits 8
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from compute import CORE_BUDGET, limit_process_threads, thread_allotment
+
+def _fit(documents: List[str], embeddings: np.ndarray):
+    from modeling import TOPICS_CONFIG, build_topic_model
+    build_topic_model(TOPICS_CONFIG, n_documents=len(documents)).fit_transform(documents, embeddings)
+
+def run_mode(mode: str, mailboxes: list, concurrency: int) -> Dict:
+    """Fit every mailbox, concurrency at a time; budgeted fits split the core budget."""
+    import modeling  # noqa: F401 (loads numba and BLAS before their limits are set)
+    threads = max(1, CORE_BUDGET // concurrency)
+    if mode == "budgeted":
+        limit_process_threads(threads)
+
+    def fit(mailbox):
+        if mode == "budgeted":
+            with thread_allotment(threads):
+                _fit(*mailbox)
+        else:
+            _fit(*mailbox)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fit, mailboxes))
+    seconds = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "threads_per_fit": threads if mode == "budgeted" else None,
+        "seconds": round(seconds, 3),
+        "fits_per_minute": round(len(mailboxes) * 60 / seconds, 2)
+    }
+
+def run_isolated(*args) -> Dict:
+    """run_mode in a fresh spawned process, so one mode's thread limits don't leak into the next."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_mode, *args).result()
+
+def load_mailboxes(size: int, fits: int, seed: int) -> list:
+    from benchmarks.pipeline_stages import StubEmbeddingModel
+    from benchmarks.synthetic import generate_mailbox
+    model = StubEmbeddingModel()
+    mailboxes = []
+    for i in range(fits):
+        mailbox = generate_mailbox(size, f"bench-concurrent-{i}@example.com", seed=seed + i)
+        documents = [f"{subj} {summary}".strip() for subj, summary in zip(mailbox["subj"], mailbox["summary"])]
+        mailboxes.append((documents, model.encode(documents)))
+    return mailboxes
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare concurrent fit throughput with and without the core budget.")
+    parser.add_argument("--size", type=int, default=5000, help="Emails per synthetic mailbox")
+    parser.add_argument("--concurrency", type=int, default=4, help="Fits running at once")
+    parser.add_argument("--fits", type=int, default=8, help="Mailboxes fitted per mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    mailboxes = load_mailboxes(args.size, args.fits, args.seed)
+    print(f"Fitting {args.fits} mailboxes of {args.size} emails, {args.concurrency} at a time, on a budget of {CORE_BUDGET} cores")
+
+    results = [run_isolated("budgeted", mailboxes[:1], 1)]
+    for mode in ("unbudgeted", "budgeted"):
+        results.append(run_isolated(mode, mailboxes, args.concurrency))
+    for result in results:
+        print(f"{result['mode']} x{result['concurrency']}: {result['fits_per_minute']} fits/min ({result['seconds']}s)")
+
+    report = {
+        "size": args.size,
+        "fits": args.fits,
+        "core_budget": CORE_BUDGET,
+        "python": platform.python_version(),
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
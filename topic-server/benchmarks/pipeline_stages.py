@@ -0,0 +1,321 @@
+"""
+Stage-by-stage benchmark of the /topics and /topics_incremental pipelines.
+
+For each mailbox size a synthetic mailbox (benchmarks/synthetic.py) is loaded into the
+local Postgres under its own user, then the pipeline is run with stubbed embeddings and
+its stages (fetch, embed, reduce, cluster, topic naming, storing, JSON serialization)
+are timed separately. /topics runs through pipeline.compute_topics itself and reports
+the stages its metrics trace records; these nest, e.g. "reduce" is part of "fit". Results go to a JSON file per commit, and
+--compare prints the per-stage change against an earlier file.
+
+Run from topic-server/ with the database from docker-compose up:
+
+    python -m benchmarks.pipeline_stages --sizes 1000,10000
+    python -m benchmarks.pipeline_stages --sizes 1000,10000 --compare benchmarks/results/<old commit>.json
+
+The benchmark users (bench-<size>@example.com), their rows and their artifacts are
+deleted afterwards unless --keep is given.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+import embeddings
+from artifacts import artifact_path
+from benchmarks.synthetic import generate_mailbox
+from db import get_db_connection, release_db_connection
+from formats import JSON, render, topic_table
+
+STUB_DIMENSIONS = 384  # same as all-MiniLM-L6-v2, so stored vectors fit the same indexes
+
+class StubEmbeddingModel:
+    """
+    Stands in for the sentence-transformer: each document is the normalized sum of
+    fixed pseudo-random vectors of its words, so documents sharing words land close
+    together and clustering still has structure to find. Deterministic and cheap.
+    """
+    def __init__(self, dimensions: int = STUB_DIMENSIONS):
+        self.dimensions = dimensions
+        self._word_vectors = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def encode(self, documents: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        vectors = np.zeros((len(documents), self.dimensions), dtype=np.float32)
+        for i, doc in enumerate(documents):
+            for word in doc.lower().split():
+                vectors[i] += self._word_vector(word.strip(".,;:"))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+class StageTimer:
+    """Collects wall time per named stage; a stage timed twice accumulates."""
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def wrap(self, obj, method: str, name: str):
+        """Time every call of obj.method under name, keeping obj's type (BERTopic checks isinstance)."""
+        original = getattr(obj, method)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return original(*args, **kwargs)
+        setattr(obj, method, timed)
+
+    def rounded(self) -> Dict[str, float]:
+        return {name: round(seconds, 4) for name, seconds in self.stages.items()}
+
+def load_mailbox(user_email: str, size: int, seed: int):
+    """Replace the benchmark user's rows with a fresh synthetic mailbox of the given size."""
+    mailbox = generate_mailbox(size, user_email, seed=seed)
+    frame = pd.DataFrame({k: v for k, v in mailbox.items() if k != "theme"})
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        delete_user(cur, user_email)
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cur.copy_expert(
+            f"COPY Emails ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+# Tables the pipelines write for a user, cleared before each run
+TOPIC_TABLES = ("GroupEmail", "Groups", "EmailEmbeddings", "TopicCentroids", "MailboxWatermarks")
+
+def delete_user(cur, user_email: str, tables=TOPIC_TABLES + ("Emails",)):
+    for table in tables:
+        cur.execute(f"DELETE FROM {table} WHERE user_email_address = %s", (user_email,))
+
+def reset_user(user_email: str, tables=TOPIC_TABLES, remove_artifacts: bool = True):
+    """Delete the user's rows from tables and, unless told otherwise, their artifacts."""
+    conn = get_db_connection()
+    try:
+        delete_user(conn.cursor(), user_email, tables)
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+    if remove_artifacts:
+        from pipeline import MODEL_TIME_WINDOWS
+        for window in [None] + [label for label, _ in MODEL_TIME_WINDOWS]:
+            shutil.rmtree(artifact_path(user_email, window), ignore_errors=True)
+
+def fit_timed(timer: StageTimer, config: dict, documents: List[str], vectors: np.ndarray, prefix: str = ""):
+    """Fit a topic model, splitting its time into reduce, cluster and (the rest) topic naming."""
+    from modeling import build_topic_model
+    topic_model = build_topic_model(config, n_documents=len(documents))
+    for method in ("fit", "transform", "fit_transform"):
+        if hasattr(topic_model.umap_model, method):
+            timer.wrap(topic_model.umap_model, method, f"{prefix}reduce")
+    for method in ("fit", "fit_predict", "predict"):
+        if hasattr(topic_model.hdbscan_model, method):
+            timer.wrap(topic_model.hdbscan_model, method, f"{prefix}cluster")
+    with timer.stage(f"{prefix}fit_total"):
+        topics, _ = topic_model.fit_transform(documents, vectors)
+    stages = timer.stages
+    stages[f"{prefix}topic_naming"] = stages[f"{prefix}fit_total"] - stages.get(f"{prefix}reduce", 0) - stages.get(f"{prefix}cluster", 0)
+    del stages[f"{prefix}fit_total"]
+    return topic_model, topics
+
+def label_frame(frame: pd.DataFrame, topics, topic_info: pd.DataFrame) -> pd.DataFrame:
+    from pipeline import label_topics
+
+    frame = frame.copy()
+    frame["group_id"], frame["topic_name"] = label_topics(topics, topic_info)
+    return frame
+
+def trace_stages(trace) -> Dict[str, float]:
+    """Wall time per stage of a metrics trace; a stage recorded more than once accumulates."""
+    stages: Dict[str, float] = {}
+    for entry in trace.stages:
+        stages[entry["stage"]] = stages.get(entry["stage"], 0.0) + entry["seconds"]
+    return {name: round(seconds, 4) for name, seconds in stages.items()}
+
+def bench_topics(user_email: str) -> Dict:
+    """
+    The /topics pipeline as the job runs it, pipeline.compute_topics(refit=True), timed by
+    its own stage() instrumentation: dedup, the stratified sample fit (with reduce, cluster
+    and ctfidf inside "fit") and the batched assignment of the rest are all included.
+    """
+    from metrics import start_trace
+    from pipeline import compute_topics
+
+    trace = start_trace("topics")
+    result = compute_topics(user_email, refit=True)
+    stages = trace_stages(trace)
+    start = time.perf_counter()
+    body = render(result, JSON)
+    stages["serialize"] = round(time.perf_counter() - start, 4)
+    topic_info = result["topics"]
+    return {
+        "stages": stages,
+        "n_documents": len(result["email_topics"]),
+        "n_topics": int((topic_info["Topic"] != -1).sum()),
+        "response_bytes": len(body)
+    }
+
+def bench_topics_incremental(user_email: str) -> Dict:
+    """
+    The /topics_incremental pipeline, stage by stage, in TOPIC_INCREMENTAL_MODE:
+    one fit sliced into the shorter windows, or the windows fit one after another.
+    """
+    from artifacts import document_term_counts, load_artifact, save_artifact, slice_artifact
+    from pipeline import INCREMENTAL_MODE, MODEL_CONFIGS, MODEL_TIME_WINDOWS, fetch_user_emails, load_embeddings, store_topics_in_db
+
+    timer = StageTimer()
+    with timer.stage("fetch"):
+        emails = fetch_user_emails(user_email)
+    email_df = pd.DataFrame(emails, copy=False)
+    now = pd.Timestamp.now()
+    longest_label, longest_days = max(MODEL_TIME_WINDOWS, key=lambda window: window[1])
+    superset_df = email_df[email_df["date_sent"] >= (now - pd.Timedelta(days=longest_days))]
+    with timer.stage("embed"):
+        vectors, model_name, missing = load_embeddings(user_email, superset_df["email_id"].tolist(), superset_df["email_text"].tolist())
+    superset_df = superset_df[~missing]
+
+    parent = None
+    if INCREMENTAL_MODE == "hierarchical" and len(superset_df):
+        documents = superset_df["email_text"].tolist()
+        topic_model, parent_topics = fit_timed(timer, MODEL_CONFIGS[longest_label], documents, vectors, prefix=f"{longest_label}.")
+        with timer.stage(f"{longest_label}.save_artifact"):
+            save_artifact(topic_model, artifact_path(user_email, longest_label), model_name, documents, parent_topics)
+        parent_info = topic_model.get_topic_info()
+        parent_topics = np.asarray(parent_topics, dtype=np.int64)
+        parent = load_artifact(artifact_path(user_email, longest_label))
+        with timer.stage("term_counts"):
+            doc_term_counts = document_term_counts(parent, documents)
+
+    windows = {}
+    payload = {}
+    for label, days in MODEL_TIME_WINDOWS:
+        mask = (superset_df["date_sent"] >= (now - pd.Timedelta(days=days))).to_numpy()
+        window_df = superset_df[mask]
+        documents = window_df["email_text"].tolist()
+        if not documents:
+            continue
+        if parent is not None and label == longest_label:
+            topics, topic_info = parent_topics, parent_info
+        elif parent is not None:
+            topics = parent_topics[mask]
+            with timer.stage(f"{label}.slice"):
+                topic_info = slice_artifact(artifact_path(user_email, label), parent, topics, doc_term_counts[mask], vectors[mask])
+        else:
+            topic_model, topics = fit_timed(timer, MODEL_CONFIGS[label], documents, vectors[mask], prefix=f"{label}.")
+            with timer.stage(f"{label}.save_artifact"):
+                save_artifact(topic_model, artifact_path(user_email, label), model_name, documents, topics)
+            topic_info = topic_model.get_topic_info()
+        window_df = label_frame(window_df, topics, topic_info)
+        with timer.stage(f"{label}.store"):
+            store_topics_in_db(user_email, window_df)
+        windows[label] = {"n_documents": len(documents), "n_topics": int((topic_info["Topic"] != -1).sum())}
+        if label == "3_months":
+            payload[label] = {
+                "topics": topic_table(topic_info),
+                "email_topics": window_df[["email_id", "group_id", "topic_name"]].reset_index(drop=True)
+            }
+
+    with timer.stage("serialize"):
+        body = render(payload, JSON)
+    return {"stages": timer.rounded(), "windows": windows, "response_bytes": len(body)}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results: Dict, baseline_file: str):
+    """Print each stage's time against the same stage in an earlier results file."""
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    old = {(r["size"], r["pipeline"]): r["stages"] for r in baseline["results"]}
+    print(f"Compared with {baseline.get('commit')} ({baseline_file}):")
+    for result in results["results"]:
+        before = old.get((result["size"], result["pipeline"]))
+        if before is None:
+            continue
+        for stage, seconds in result["stages"].items():
+            if stage in before and before[stage] > 0:
+                change = (seconds - before[stage]) / before[stage]
+                print(f"  {result['pipeline']:<18} {result['size']:>7} {stage:<26} {before[stage]:>9.3f}s -> {seconds:>9.3f}s ({change:+.0%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of the topic pipelines on synthetic mailboxes.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated mailbox sizes")
+    parser.add_argument("--pipelines", default="topics,topics_incremental", help="Comma-separated pipelines to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark users' rows and artifacts")
+    args = parser.parse_args()
+
+    # Stub the embedding model before anything asks for it
+    embeddings._embedding_model = StubEmbeddingModel()
+    runners = {"topics": bench_topics, "topics_incremental": bench_topics_incremental}
+    from pipeline import INCREMENTAL_MODE
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "embeddings": "stub",
+        "incremental_mode": INCREMENTAL_MODE,
+        "results": []
+    }
+    for size in [int(s) for s in args.sizes.split(",")]:
+        user_email = f"bench-{size}@example.com"
+        print(f"Loading {size} synthetic emails for {user_email}")
+        load_mailbox(user_email, size, args.seed)
+        try:
+            for pipeline_name in args.pipelines.split(","):
+                # Start every pipeline from an empty embedding cache and no stored topics
+                reset_user(user_email)
+                result = runners[pipeline_name](user_email)
+                results["results"].append({"size": size, "pipeline": pipeline_name, **result})
+                print(f"  {pipeline_name}: {result['stages']}")
+        finally:
+            if not args.keep:
+                reset_user(user_email, TOPIC_TABLES + ("Emails",))
+
+    output = args.output or os.path.join("benchmarks", "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
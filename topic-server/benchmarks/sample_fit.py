@@ -0,0 +1,132 @@
+"""
+Measure the large-mailbox mode of /topics: fit on a stratified sample of at most
+--caps emails (sampling.stratified_sample), then assign the rest to the sample's topic
+centroids in batches, against a fit on every email.
+
+Each run happens in a fresh process so its peak RSS is its own. The report gives fit
+and assign time, peak RSS, topic count, outlier rate and agreement (ARI / NMI) with the
+full fit; on the synthetic corpus, also agreement with the ground-truth themes.
+
+Run from topic-server/:
+
+    python -m benchmarks.sample_fit --synthetic 100000 --caps 5000,20000
+    python -m benchmarks.sample_fit --user-email someone@example.com --output sample_fit.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+
+from sampling import ASSIGN_BATCH_SIZE, stratified_sample
+
+def run_fit(documents: List[str], embeddings: np.ndarray, dates_sent: np.ndarray, senders: np.ndarray, cap: int) -> Dict:
+    """Fit on up to cap stratified emails (all of them for cap 0) and assign the rest as /topics does."""
+    from artifacts import assign_topics, load_artifact, save_artifact
+    from modeling import TOPICS_CONFIG, build_topic_model
+    from pipeline import UPDATE_MIN_SIMILARITY
+
+    fit_rows = stratified_sample(dates_sent, senders, cap)
+    fit_documents = [documents[i] for i in fit_rows]
+    topic_model = build_topic_model(TOPICS_CONFIG, n_documents=len(fit_rows))
+    start = time.perf_counter()
+    fit_topics, _ = topic_model.fit_transform(fit_documents, embeddings[fit_rows])
+    fit_seconds = time.perf_counter() - start
+
+    topics = np.empty(len(documents), dtype=np.int64)
+    topics[fit_rows] = fit_topics
+    rest = np.setdiff1d(np.arange(len(documents)), fit_rows)
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as path:
+        save_artifact(topic_model, path, "benchmark", fit_documents, fit_topics)
+        artifact = load_artifact(path)
+        for batch in range(0, len(rest), ASSIGN_BATCH_SIZE):
+            rows = rest[batch:batch + ASSIGN_BATCH_SIZE]
+            topics[rows] = assign_topics(artifact, embeddings[rows], UPDATE_MIN_SIMILARITY)
+    assign_seconds = time.perf_counter() - start
+
+    return {
+        "cap": cap,
+        "fit_documents": len(fit_rows),
+        "fit_seconds": round(fit_seconds, 3),
+        "assign_seconds": round(assign_seconds, 3),
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,  # kilobytes on Linux
+        "n_topics": len(set(topics.tolist()) - {-1}),
+        "outlier_rate": round(float((topics == -1).mean()), 4),
+        "topics": topics
+    }
+
+def run_isolated(*args) -> Dict:
+    """run_fit in a fresh spawned process, so the reported peak RSS is this run's alone."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_fit, *args).result()
+
+def load_corpus(args):
+    """Documents, embeddings, dates, senders and (synthetic corpus only) true themes."""
+    if args.user_email:
+        from pipeline import fetch_user_emails, load_embeddings
+        emails = fetch_user_emails(args.user_email)
+        documents = emails["email_text"].tolist()
+        embeddings, _, missing = load_embeddings(args.user_email, emails["email_id"].tolist(), documents)
+        # Emails without a stored vector (EMBEDDING_SOURCE=stored) are left out, as in /topics
+        emails = {name: column[~missing] for name, column in emails.items()}
+        documents = emails["email_text"].tolist()
+        return documents, embeddings, emails["date_sent"], emails["sender_email"], None
+
+    from benchmarks.pipeline_stages import StubEmbeddingModel
+    from benchmarks.synthetic import generate_mailbox
+    mailbox = generate_mailbox(args.synthetic, "bench-sample@example.com", seed=args.seed)
+    documents = [f"{subj} {summary}".strip() for subj, summary in zip(mailbox["subj"], mailbox["summary"])]
+    embeddings = StubEmbeddingModel().encode(documents)
+    dates_sent = np.array(mailbox["date_sent"], dtype="datetime64[us]")
+    return documents, embeddings, dates_sent, np.array(mailbox["sender_email"], dtype=object), mailbox["theme"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sample-then-assign fits with a full fit on one corpus.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--user-email", help="Use this user's mailbox from Postgres")
+    source.add_argument("--synthetic", type=int, help="Use a synthetic mailbox of this size with stub embeddings")
+    parser.add_argument("--caps", default="5000,10000,20000", help="Comma-separated sample caps to compare with the full fit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    documents, embeddings, dates_sent, senders, themes = load_corpus(args)
+    print(f"Comparing sampled fits on {len(documents)} documents")
+
+    results = [run_isolated(documents, embeddings, dates_sent, senders, cap) for cap in [0] + [int(c) for c in args.caps.split(",")]]
+    reference = results[0]["topics"]
+    for result in results:
+        topics = result.pop("topics")
+        result["ari_vs_full_fit"] = round(adjusted_rand_score(reference, topics), 4)
+        result["nmi_vs_full_fit"] = round(normalized_mutual_info_score(reference, topics), 4)
+        if themes is not None:
+            result["ari_vs_themes"] = round(adjusted_rand_score(themes, topics), 4)
+            result["nmi_vs_themes"] = round(normalized_mutual_info_score(themes, topics), 4)
+        print(f"cap {result['cap'] or 'none'}: fit {result['fit_seconds']}s, assign {result['assign_seconds']}s, "
+              f"peak RSS {result['peak_rss_bytes'] / 2 ** 20:.0f} MiB, ARI vs full fit {result['ari_vs_full_fit']}")
+
+    report = {
+        "n_documents": len(documents),
+        "corpus": "mailbox" if args.user_email else "synthetic",
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "assign_batch_size": ASSIGN_BATCH_SIZE,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Deterministic synthetic mailboxes for benchmarks.
+
+Emails are drawn from a fixed set of themes, so they cluster the way real mail does,
+and read like the one-line summaries the web app stores (subject plus summary). Senders
+follow a Zipf-like distribution and dates decay exponentially into the past with a
+weekday / business-hours rhythm. The same (n, seed) always gives the same mailbox,
+relative to the reference time.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+THEMES = {
+    "billing": ["invoice", "payment", "receipt", "refund", "subscription", "charge", "billing", "overdue"],
+    "travel": ["flight", "hotel", "itinerary", "booking", "boarding", "reservation", "airport", "checkin"],
+    "recruiting": ["interview", "candidate", "offer", "resume", "recruiter", "position", "onsite", "hiring"],
+    "engineering": ["deploy", "pull", "request", "build", "incident", "outage", "release", "review"],
+    "meetings": ["meeting", "calendar", "agenda", "reschedule", "invite", "sync", "standup", "notes"],
+    "shopping": ["order", "shipped", "delivery", "package", "tracking", "cart", "discount", "return"],
+    "newsletters": ["newsletter", "weekly", "digest", "issue", "subscribe", "article", "roundup", "edition"],
+    "security": ["password", "login", "verification", "code", "alert", "device", "suspicious", "reset"],
+    "school": ["assignment", "lecture", "grade", "professor", "syllabus", "exam", "course", "deadline"],
+    "banking": ["statement", "transfer", "deposit", "balance", "account", "card", "transaction", "loan"],
+    "social": ["party", "dinner", "weekend", "birthday", "photos", "plans", "friends", "invite"],
+    "housing": ["lease", "rent", "landlord", "maintenance", "apartment", "utilities", "inspection", "move"],
+    "health": ["appointment", "doctor", "prescription", "insurance", "clinic", "results", "checkup", "claim"],
+    "support": ["ticket", "support", "issue", "resolved", "customer", "case", "response", "escalated"],
+    "marketing": ["campaign", "launch", "audience", "analytics", "conversion", "brand", "budget", "creative"]
+}
+
+FILLER = ["update", "request", "follow", "question", "details", "confirm", "information", "today",
+          "tomorrow", "please", "regarding", "latest", "quick", "reminder", "status", "next"]
+
+SUBJECT_TEMPLATES = [
+    "{a} {b}",
+    "Re: {a} {b}",
+    "Your {a} {b} {f}",
+    "{f}: {a} and {b}",
+    "Fwd: {a} {f}"
+]
+
+SUMMARY_TEMPLATES = [
+    "The sender shares {a} {b} details and asks to {f} the {c}.",
+    "A {f} about the {a} with {b} and {c} information.",
+    "Notification that the {a} {b} is ready; {c} {f} needed.",
+    "{sender} writes about {a}, {b} and the {c} {f}.",
+    "Reminder regarding {a} {c}; the {b} {f} is attached."
+]
+
+def _dates(rng: np.random.Generator, n: int, reference: datetime, max_days: int) -> np.ndarray:
+    """Exponential recency (mean 18 months) with weekday and business-hours weighting."""
+    days = np.minimum(rng.exponential(scale=540, size=n), max_days - 1).astype(int)
+    dates = np.array([reference - timedelta(days=int(d)) for d in days], dtype="datetime64[s]")
+    # Push a weekend share of the mail onto the previous Friday
+    weekday = (dates.astype("datetime64[D]").view("int64") - 4) % 7  # 1970-01-01 was a Thursday
+    weekend = (weekday >= 5) & (rng.random(n) < 0.6)
+    dates[weekend] -= np.timedelta64(1, "D") * (weekday[weekend] - 4)
+    hours = np.clip(rng.normal(13, 3.5, size=n), 0, 23.99)
+    seconds = (hours * 3600).astype("int64")
+    return dates.astype("datetime64[D]").astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+
+def generate_mailbox(n: int, user_email: str, seed: int = 0, reference: Optional[datetime] = None, max_days: int = 5 * 365) -> Dict[str, List]:
+    """
+    n synthetic emails for user_email as columns matching the Emails table
+    (email_id, user_email_address, sender_email, receiver_emails, subj, body, summary, date_sent),
+    plus "theme", the ground-truth topic of each email.
+    """
+    rng = np.random.default_rng(seed)
+    reference = reference or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    theme_names = list(THEMES)
+    # Uneven theme sizes, like a real mailbox
+    theme_weights = rng.dirichlet(np.full(len(theme_names), 0.8))
+    themes = rng.choice(len(theme_names), size=n, p=theme_weights)
+
+    n_senders = max(5, n // 20)
+    sender_weights = 1.0 / np.arange(1, n_senders + 1)
+    senders = rng.choice(n_senders, size=n, p=sender_weights / sender_weights.sum())
+
+    subjects, summaries = [], []
+    for i in range(n):
+        words = THEMES[theme_names[themes[i]]]
+        a, b, c = rng.choice(words, size=3, replace=False)
+        fill = {"a": a, "b": b, "c": c, "f": FILLER[rng.integers(len(FILLER))], "sender": f"Sender {senders[i]}"}
+        subjects.append(SUBJECT_TEMPLATES[rng.integers(len(SUBJECT_TEMPLATES))].format(**fill))
+        summaries.append(SUMMARY_TEMPLATES[rng.integers(len(SUMMARY_TEMPLATES))].format(**fill))
+
+    prefix = user_email.split("@")[0]
+    return {
+        "email_id": [f"{prefix}-{seed}-{i:07d}" for i in range(n)],
+        "user_email_address": [user_email] * n,
+        "sender_email": [f"sender{s}@example.com" for s in senders],
+        "receiver_emails": [user_email] * n,
+        "subj": subjects,
+        "body": [""] * n,
+        "summary": summaries,
+        "date_sent": _dates(rng, n, reference, max_days).tolist(),
+        "theme": [theme_names[t] for t in themes]
+    }
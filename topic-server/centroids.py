@@ -0,0 +1,82 @@
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from embeddings import to_vector_literal
+
+# Topic centroids in pgvector, so new mail can be labeled with one nearest-neighbor
+# query and no topic model in memory. TopicCentroids has one HNSW index per embedding
+# model on centroid::vector(<dims>); queries cast to the same dimension to use it.
+
+# Whether the server's pgvector has hnsw.iterative_scan (0.8+), looked up once per process
+_iterative_scan = None
+_iterative_scan_lock = threading.Lock()
+
+def _supports_iterative_scan(cur) -> bool:
+    global _iterative_scan
+    with _iterative_scan_lock:
+        if _iterative_scan is None:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cur.fetchone()
+            version = tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+            _iterative_scan = version >= (0, 8)
+        return _iterative_scan
+
+def save_centroids(cur, user_email: str, model_name: str, topic_ids: List[int], names: List[str], vectors: np.ndarray):
+    """
+    Replace the user's stored centroids with those of their current topic model. Each
+    centroid keeps its topic's name, since Groups may hold names from another model
+    (e.g. a /topics_incremental window) for the same group_id.
+    """
+    cur.execute("DELETE FROM TopicCentroids WHERE user_email_address = %s", (user_email,))
+    if not topic_ids:
+        return
+    execute_values(
+        cur,
+        """
+        INSERT INTO TopicCentroids (user_email_address, group_id, model_name, name, centroid)
+        VALUES %s
+        """,
+        [
+            (user_email, int(tid), model_name, name, to_vector_literal(vector))
+            for tid, name, vector in zip(topic_ids, names, vectors)
+        ],
+        template="(%s, %s, %s, %s, %s::vector)"
+    )
+
+def centroid_model(cur, user_email: str) -> Optional[str]:
+    """The embedding model the user's stored centroids are in, or None if they have none."""
+    cur.execute("SELECT model_name FROM TopicCentroids WHERE user_email_address = %s LIMIT 1", (user_email,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def nearest_topics(cur, user_email: str, model_name: str, embeddings: np.ndarray) -> List[Tuple[int, str, float]]:
+    """
+    (group_id, topic name, cosine distance) of the closest stored centroid for each
+    embedding, in order, from a single query. Rows are None where the user has no
+    centroids for model_name.
+    """
+    dims = int(embeddings.shape[1])
+    # Keep scanning the HNSW graph until the user's own centroids turn up, instead of
+    # returning nothing when the nearest neighbours belong to other users. Older pgvector
+    # has no such setting and may then miss a user's centroids on a crowded index.
+    if _supports_iterative_scan(cur):
+        cur.execute("SET LOCAL hnsw.iterative_scan = strict_order")
+    cur.execute(
+        f"""
+        SELECT c.group_id, c.name, c.distance
+        FROM unnest(%s::text[]) WITH ORDINALITY AS d(embedding, ord)
+        LEFT JOIN LATERAL (
+            SELECT group_id, name, centroid::vector({dims}) <=> d.embedding::vector({dims}) AS distance
+            FROM TopicCentroids
+            WHERE user_email_address = %s AND model_name = %s
+            ORDER BY centroid::vector({dims}) <=> d.embedding::vector({dims})
+            LIMIT 1
+        ) c ON true
+        ORDER BY d.ord
+        """,
+        ([to_vector_literal(vector) for vector in embeddings], user_email, model_name)
+    )
+    return [None if row[0] is None else row for row in cur.fetchall()]
@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+# CPU budgeting for the modeling work. UMAP (numba), HDBSCAN (joblib), torch and BLAS
+# each size their thread pools to the whole machine, so concurrent jobs oversubscribe
+# the cores. Each job instead runs with an explicit allotment of the core budget.
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # respects taskset / container CPU sets
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Cores the modeling work of this process may use in total
+CORE_BUDGET = int(os.environ.get("TOPIC_CORE_BUDGET", _available_cores()))
+
+_local = threading.local()
+
+def allotted_threads() -> int:
+    """Threads the modeling work on the calling thread may use (the whole budget outside thread_allotment)."""
+    return getattr(_local, "threads", CORE_BUDGET)
+
+def _set_numba_threads(threads: int):
+    # numba's thread count is per calling thread; skip it if UMAP hasn't loaded numba
+    numba = sys.modules.get("numba")
+    if numba is not None:
+        numba.set_num_threads(max(1, min(threads, numba.config.NUMBA_NUM_THREADS)))
+
+@contextmanager
+def thread_allotment(threads: int):
+    """
+    Run the block with `threads` threads: numba parallel loops started from this thread
+    use that many, and models built in it get n_jobs from allotted_threads().
+    """
+    previous = getattr(_local, "threads", None)
+    _local.threads = threads
+    _set_numba_threads(threads)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _local.threads
+        else:
+            _local.threads = previous
+        _set_numba_threads(allotted_threads())
+
+def limit_process_threads(threads: int):
+    """
+    Cap this process's shared pools, BLAS/OpenMP (through threadpoolctl) and torch's
+    intra-op pool, at `threads`. These pools are process-wide, so call this once the
+    libraries are loaded, with the allotment of one job.
+    """
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
@@ -0,0 +1,300 @@
+import asyncio
+import base64
+import binascii
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+import asyncpg
+from fastapi import HTTPException
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import POOL_WAIT_SECONDS
+
+DB_CONFIG = {
+    "dbname": "clustermail",
+    "user": "postgres",
+    "password": "postgres",
+    "host": "localhost",
+    "port": "6543"
+}
+
+# Write/modeling paths: thread-safe psycopg2 pool shared by the job threads
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+# Seconds to wait for a free connection before giving up with a 503
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+# Read endpoints: asyncpg pool
+READ_POOL_MIN = int(os.environ.get("READ_POOL_MIN", 1))
+READ_POOL_MAX = int(os.environ.get("READ_POOL_MAX", 20))
+READ_POOL_TIMEOUT = float(os.environ.get("READ_POOL_TIMEOUT", 5))
+# Prepared statements cached per connection; the read queries are reused constantly
+READ_STATEMENT_CACHE_SIZE = int(os.environ.get("READ_STATEMENT_CACHE_SIZE", 100))
+# Rows fetched per round trip by the server-side cursor behind NDJSON exports
+READ_STREAM_PREFETCH = int(os.environ.get("READ_STREAM_PREFETCH", 500))
+
+_connection_pool = None
+_connection_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_pool_lock = threading.Lock()
+
+def get_db_connection():
+    """
+    Retrieve a connection from the pool, waiting up to DB_POOL_TIMEOUT seconds for one to be released.
+    The pool is created on first use, so processes that only serve reads never open it.
+    """
+    global _connection_pool
+    start = time.perf_counter()
+    acquired = _connection_slots.acquire(timeout=DB_POOL_TIMEOUT)
+    POOL_WAIT_SECONDS.labels("modeling").observe(time.perf_counter() - start)
+    if not acquired:
+        raise HTTPException(status_code=503, detail="Database connection pool exhausted.")
+    try:
+        with _pool_lock:
+            if _connection_pool is None:
+                _connection_pool = ThreadedConnectionPool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, **DB_CONFIG)
+        return _connection_pool.getconn()
+    except Exception:
+        _connection_slots.release()
+        raise
+
+def release_db_connection(conn):
+    """Return a connection to the pool."""
+    _connection_pool.putconn(conn)
+    _connection_slots.release()
+
+# Task creating the asyncpg pool; created lazily because asyncio objects made at
+# import time on Python 3.9 would bind to the wrong event loop
+_read_pool = None
+
+async def get_read_pool() -> asyncpg.Pool:
+    """Create the asyncpg pool for the read endpoints on first use."""
+    global _read_pool
+    if _read_pool is None:
+        _read_pool = asyncio.ensure_future(asyncpg.create_pool(
+            database=DB_CONFIG["dbname"],
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            host=DB_CONFIG["host"],
+            port=int(DB_CONFIG["port"]),
+            min_size=READ_POOL_MIN,
+            max_size=READ_POOL_MAX,
+            statement_cache_size=READ_STATEMENT_CACHE_SIZE
+        ))
+    try:
+        return await _read_pool
+    except Exception:
+        _read_pool = None
+        raise
+
+async def close_read_pool():
+    global _read_pool
+    if _read_pool is not None:
+        pool, _read_pool = _read_pool, None
+        await (await pool).close()
+
+async def acquire_read_connection(pool: asyncpg.Pool):
+    """Acquire a read connection, failing with a 503 if none frees up within READ_POOL_TIMEOUT."""
+    start = time.perf_counter()
+    try:
+        return await pool.acquire(timeout=READ_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Database connection pool exhausted.")
+    finally:
+        POOL_WAIT_SECONDS.labels("read").observe(time.perf_counter() - start)
+
+async def read_query(query: str, *args):
+    """Run a read query on the async pool."""
+    pool = await get_read_pool()
+    conn = await acquire_read_connection(pool)
+    try:
+        return await conn.fetch(query, *args)
+    finally:
+        await pool.release(conn)
+
+class RowStream:
+    """
+    Rows of a query streamed through a server-side cursor, passed through transform.
+    The stream holds its pool connection until close(). The response closes it from a
+    background task, so the connection is returned even if the client leaves before the
+    first row is requested.
+    """
+    def __init__(self, pool: asyncpg.Pool, conn, query: str, args: tuple, transform: Callable):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+        self._rows = self._stream(query, args, transform)
+
+    async def _stream(self, query: str, args: tuple, transform: Callable):
+        try:
+            # asyncpg cursors only exist inside a transaction
+            async with self._conn.transaction():
+                async for row in self._conn.cursor(query, *args, prefetch=READ_STREAM_PREFETCH):
+                    yield transform(row)
+        finally:
+            await self._release()
+
+    def __aiter__(self):
+        return self._rows
+
+    async def _release(self):
+        if not self._released:
+            self._released = True
+            await self._pool.release(self._conn)
+
+    async def close(self):
+        """End the cursor's transaction if streaming started, and return the connection to the pool."""
+        await self._rows.aclose()
+        await self._release()
+
+async def stream_query(query: str, *args, transform: Callable = tuple) -> RowStream:
+    """
+    Run a read query through a server-side cursor, yielding transform(row) as Postgres
+    produces rows. The connection is acquired before the first row is requested, so an
+    exhausted pool still answers 503 instead of failing a response that has already started.
+    """
+    pool = await get_read_pool()
+    conn = await acquire_read_connection(pool)
+    return RowStream(pool, conn, query, args, transform)
+
+def encode_cursor(key: list) -> str:
+    """Opaque page token for the sort key of the last row returned."""
+    date_sent, *rest = key
+    payload = [date_sent.isoformat() if date_sent is not None else None, *rest]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, key_length: int) -> list:
+    """Inverse of encode_cursor; a token that doesn't decode to a sort key of the expected length is a 400."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(key, list) or len(key) != key_length:
+            raise ValueError(key)
+        if key[0] is not None:
+            key[0] = datetime.fromisoformat(key[0])
+        return key
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _after_cursor(key: list, columns: List[Tuple[str, str]], params: list) -> str:
+    """
+    SQL condition selecting the rows that come after `key` in
+    `ORDER BY e.date_sent DESC, <columns> DESC` order, appending its values to params.
+    columns are (expression, type) pairs; the casts let Postgres type the row comparison.
+    NULL dates sort first in descending order, so they are handled separately.
+    With more than one column, the condition repeats on (date_sent, first column) alone,
+    which the (user_email_address, date_sent, email_id) index can serve as a range scan;
+    the full comparison includes columns of other tables and only filters after the join.
+    """
+    date_sent, *rest = key
+    if date_sent is not None:
+        params.append(date_sent)
+        date_placeholder = f"${len(params)}::timestamp"
+    placeholders = []
+    for column, value in zip(columns, rest):
+        params.append(value)
+        placeholders.append(f"${len(params)}::{column[1]}")
+    names = ", ".join(column[0] for column in columns)
+    if date_sent is None:
+        return f"AND (e.date_sent IS NOT NULL OR (e.date_sent IS NULL AND ({names}) < ({', '.join(placeholders)})))"
+    condition = f"AND (e.date_sent, {names}) < ({date_placeholder}, {', '.join(placeholders)})"
+    if len(columns) > 1:
+        condition += f"\n          AND (e.date_sent, {columns[0][0]}) <= ({date_placeholder}, {placeholders[0]})"
+    return condition
+
+def _page(items: list, keys: list, limit: int) -> dict:
+    """One page of results; the query fetches limit + 1 rows to know whether another page exists."""
+    next_cursor = encode_cursor(keys[limit - 1]) if len(items) > limit else None
+    return {"items": items[:limit], "next_cursor": next_cursor}
+
+RECENT_EMAIL_KEY = [("e.email_id", "text")]
+
+def _recent_emails_query(user_email: str, cursor: Optional[str], limit: Optional[int]):
+    params = [user_email]
+    after = ""
+    if cursor is not None:
+        after = _after_cursor(decode_cursor(cursor, 2), RECENT_EMAIL_KEY, params)
+    limit_clause = ""
+    if limit is not None:
+        params.append(limit)
+        limit_clause = f"LIMIT ${len(params)}"
+    query = f"""
+        SELECT e.email_id, e.subj, e.body, e.date_sent
+        FROM Emails e
+        WHERE e.user_email_address = $1
+          {after}
+        ORDER BY e.date_sent DESC, e.email_id DESC
+        {limit_clause}
+        """
+    return query, params
+
+def _recent_email(row) -> dict:
+    date_sent = row[3].isoformat() if row[3] is not None else None
+    return {"email_id": row[0], "subject": row[1], "body": row[2], "date_sent": date_sent}
+
+async def fetch_recent_emails(user_email: str, limit: int = 50, cursor: Optional[str] = None) -> dict:
+    """Fetch one page of a user's emails, newest first. Pass the returned next_cursor to get the following page."""
+    query, params = _recent_emails_query(user_email, cursor, limit + 1)
+    rows = await read_query(query, *params)
+    return _page([_recent_email(row) for row in rows], [[row[3], row[0]] for row in rows], limit)
+
+async def stream_recent_emails(user_email: str, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """Async iterator over a user's emails, newest first, straight from the database cursor."""
+    query, params = _recent_emails_query(user_email, cursor, limit)
+    return await stream_query(query, *params, transform=_recent_email)
+
+# Lookback for each /topics_by_timeframe option, in days (None = no cutoff)
+TIMEFRAME_DAYS = {"1_month": 30, "3_months": 90, "1_year": 365, "5_years": 1825, "all_time": None}
+
+# An email can sit in more than one group, so group_id breaks ties within an email
+TIMEFRAME_KEY = [("e.email_id", "text"), ("ge.group_id", "int")]
+
+def _topics_by_timeframe_query(user_email: str, timeframe: str, cursor: Optional[str], limit: Optional[int]):
+    if timeframe not in TIMEFRAME_DAYS:
+        raise HTTPException(status_code=400, detail="Invalid timeframe")
+
+    params = [user_email]
+    date_filter = ""
+    if TIMEFRAME_DAYS[timeframe] is not None:
+        params.append(datetime.now() - timedelta(days=TIMEFRAME_DAYS[timeframe]))
+        date_filter = f"AND e.date_sent >= ${len(params)}"
+    after = ""
+    if cursor is not None:
+        after = _after_cursor(decode_cursor(cursor, 3), TIMEFRAME_KEY, params)
+    limit_clause = ""
+    if limit is not None:
+        params.append(limit)
+        limit_clause = f"LIMIT ${len(params)}"
+
+    query = f"""
+        SELECT ge.group_id, g.name, ge.email_id, e.date_sent
+        FROM Emails e
+        JOIN GroupEmail ge ON ge.email_id = e.email_id AND ge.user_email_address = e.user_email_address
+        JOIN Groups g ON g.user_email_address = ge.user_email_address AND g.group_id = ge.group_id
+        WHERE ge.user_email_address = $1
+          AND e.user_email_address = $1
+          {date_filter}
+          {after}
+        ORDER BY e.date_sent DESC, e.email_id DESC, ge.group_id DESC
+        {limit_clause}
+        """
+    return query, params
+
+def _topic_email(row) -> dict:
+    return {"group_id": row[0], "topic_name": row[1], "email_id": row[2]}
+
+async def fetch_topics_by_timeframe(user_email: str, timeframe: str, limit: int = 500, cursor: Optional[str] = None) -> dict:
+    """Fetch one page of topics and corresponding emails sent within the given timeframe, newest first.
+       The date filter and the (date_sent, email_id) part of the keyset condition are driven by the
+       (user_email_address, date_sent, email_id) index on Emails.
+    """
+    query, params = _topics_by_timeframe_query(user_email, timeframe, cursor, limit + 1)
+    rows = await read_query(query, *params)
+    return _page([_topic_email(row) for row in rows], [[row[3], row[2], row[0]] for row in rows], limit)
+
+async def stream_topics_by_timeframe(user_email: str, timeframe: str, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """Async iterator over topics and corresponding emails within the timeframe, newest first, straight from the database cursor."""
+    query, params = _topics_by_timeframe_query(user_email, timeframe, cursor, limit)
+    return await stream_query(query, *params, transform=_topic_email)
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import re
+from typing import List, Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Near-duplicate collapsing ahead of /topics clustering. Newsletters, notifications
+# and reply chains produce many emails whose text is almost the same; only a few
+# members of each group are embedded and clustered, and the rest take their labels.
+
+# Estimated Jaccard similarity of two emails' word sets above which they are near-duplicates
+DEDUP_MIN_SIMILARITY = float(os.environ.get("TOPIC_DEDUP_MIN_SIMILARITY", 0.8))
+# Members of each near-duplicate group kept for clustering (0 disables collapsing).
+# More than one is kept so a large group can still form its own HDBSCAN cluster.
+DEDUP_KEEP = int(os.environ.get("TOPIC_DEDUP_KEEP", 10))
+
+# MinHash signature length, and the LSH bands it is cut into (rows per band = PERMUTATIONS / BANDS)
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+# Documents whose word hashes are gathered at once, bounding the temporary (tokens x PERMUTATIONS) array
+MINHASH_CHUNK_DOCS = 5000
+
+_TOKEN = re.compile(r"\w+")
+_rng = np.random.default_rng(0)
+_SEEDS = _rng.integers(0, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MULTIPLIERS = _rng.integers(0, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_BAND_MULTIPLIERS = _rng.integers(0, 2 ** 63, size=MINHASH_PERMUTATIONS // MINHASH_BANDS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+def minhash(documents: List[str]) -> np.ndarray:
+    """
+    MinHash signature (n_documents x MINHASH_PERMUTATIONS, uint32) of each document's set
+    of lowercased words. Each distinct text is tokenized once and each distinct word hashed
+    once per permutation (multiply-shift over a stable 64-bit hash); documents without
+    words share one signature.
+    """
+    texts = {}
+    text_ids = np.array([texts.setdefault(doc or "", len(texts)) for doc in documents], dtype=np.int64)
+    vocabulary = {}
+    indices, indptr = [], [0]
+    for text in texts:
+        indices.extend(vocabulary.setdefault(word, len(vocabulary)) for word in set(_TOKEN.findall(text.lower())))
+        indptr.append(len(indices))
+    word_hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") for word in vocabulary],
+        dtype=np.uint64
+    )
+    # One row per permutation, so the per-text minimum below runs along contiguous memory
+    table = (((word_hashes ^ _SEEDS[:, None]) * _MULTIPLIERS[:, None]) >> np.uint64(32)).astype(np.uint32)
+
+    indices = np.array(indices, dtype=np.int64)
+    indptr = np.array(indptr, dtype=np.int64)
+    signatures = np.full((MINHASH_PERMUTATIONS, len(texts)), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(texts), MINHASH_CHUNK_DOCS):
+        rows = np.arange(start, min(start + MINHASH_CHUNK_DOCS, len(texts)))
+        rows = rows[indptr[rows + 1] > indptr[rows]]
+        if len(rows) == 0:
+            continue
+        offset = indptr[rows[0]]
+        hashed = table.take(indices[offset:indptr[rows[-1] + 1]], axis=1)
+        signatures[:, rows] = np.minimum.reduceat(hashed, indptr[rows] - offset, axis=1)
+    return signatures.T[text_ids]
+
+def near_duplicate_groups(signatures: np.ndarray, min_similarity: float = DEDUP_MIN_SIMILARITY) -> np.ndarray:
+    """
+    Group id (the smallest member index) of each document, from its MinHash signature.
+    Documents that agree on every row of an LSH band land in one bucket, and each is linked
+    to the bucket's first member when their signatures estimate a Jaccard similarity of at
+    least min_similarity. Groups are the connected components of those links, so the work
+    stays linear in the mailbox size even for a bucket of thousands of identical emails.
+    """
+    n = len(signatures)
+    if n == 0:
+        return np.arange(0)
+    rows_per_band = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    sources, targets = [], []
+    for band in range(MINHASH_BANDS):
+        columns = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        # Multiplication wraps around, which is fine for a bucket key
+        keys = (columns * _BAND_MULTIPLIERS).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        starts = np.r_[True, keys[order][1:] != keys[order][:-1]]
+        leaders = order[np.maximum.accumulate(np.where(starts, np.arange(n), 0))]
+        candidates = leaders != order
+        members, leaders = order[candidates], leaders[candidates]
+        similar = (signatures[members] == signatures[leaders]).mean(axis=1) >= min_similarity
+        sources.append(members[similar])
+        targets.append(leaders[similar])
+
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    links = coo_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(n, n))
+    _, labels = connected_components(links, directed=False)
+    first = np.full(labels.max() + 1, n)
+    np.minimum.at(first, labels, np.arange(n))
+    return first[labels]
+
+def collapse_near_duplicates(documents: List[str], keep: int = DEDUP_KEEP) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pick the documents to cluster: up to `keep` members of every near-duplicate group.
+    Returns (kept, source): the indices of the kept documents, in order, and for every
+    document the position in kept of the document whose topic it takes (itself if kept,
+    otherwise its group's first member).
+    """
+    n = len(documents)
+    if keep <= 0 or n == 0:
+        return np.arange(n), np.arange(n)
+    groups = near_duplicate_groups(minhash(documents))
+    # Rank of each document within its group, in document order
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    first = np.r_[0, np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1]
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = np.arange(n) - np.repeat(first, np.diff(np.r_[first, n]))
+
+    kept = np.flatnonzero(ranks < keep)
+    position = np.full(n, -1)
+    position[kept] = np.arange(len(kept))
+    # The group id is the group's first member, which is always kept
+    source = np.where(position >= 0, position, position[groups])
+    return kept, source
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from metrics import EMBEDDING_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Name of the sentence-transformer BERTopic would otherwise load by default.
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "local" embeds with EMBEDDING_MODEL; "stored" uses the vectors the web app already
+# wrote to EmailEmbeddings under STORED_EMBEDDING_MODEL (see lib/openai.ts)
+EMBEDDING_SOURCE = os.environ.get("EMBEDDING_SOURCE", "local")
+STORED_EMBEDDING_MODEL = os.environ.get("STORED_EMBEDDING_MODEL", "text-embedding-3-small")
+# With the "stored" source, fraction of a fit's emails that must have a stored vector for the
+# fit to use them (the rest are left out of it); below it, the fit is embedded locally
+STORED_MIN_COVERAGE = float(os.environ.get("TOPIC_STORED_MIN_COVERAGE", 0.9))
+
+_embedding_model = None
+
+def get_embedding_model():
+    """Load the sentence-transformer once per process and share it between requests."""
+    global _embedding_model
+    if _embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _embedding_model
+
+def text_hash(text: str) -> str:
+    """Hash of the text an embedding was computed from."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def to_vector_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(map(str, vector.tolist())) + "]"
+
+def _parse_vector(text: str) -> np.ndarray:
+    # pgvector's text form is "[x,y,...]"
+    return np.fromstring(text[1:-1], sep=",", dtype=np.float32)
+
+def _fetch_vectors(cur, model_name: str, email_ids: List[str]) -> Dict[str, Tuple[str, str]]:
+    """email_id -> (text_hash, vector text) for the stored vectors of one model."""
+    cur.execute(
+        """
+        SELECT email_id, text_hash, embedding::text
+        FROM EmailEmbeddings
+        WHERE model_name = %s AND email_id = ANY(%s)
+        """,
+        (model_name, list(email_ids))
+    )
+    return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+def get_embeddings(conn, user_email: str, email_ids: List[str], documents: List[str]) -> np.ndarray:
+    """
+    Return one embedding per document, in order.
+    Vectors cached in EmailEmbeddings are reused when the text hash still matches;
+    only new or changed emails are embedded, and those are written back to the cache.
+    """
+    hashes = [text_hash(doc) for doc in documents]
+
+    cur = conn.cursor()
+    cached = _fetch_vectors(cur, EMBEDDING_MODEL_NAME, email_ids)
+
+    embeddings = [None] * len(documents)
+    missing = []
+    for i, (email_id, doc_hash) in enumerate(zip(email_ids, hashes)):
+        hit = cached.get(email_id)
+        if hit is not None and hit[0] == doc_hash:
+            embeddings[i] = _parse_vector(hit[1])
+        else:
+            missing.append(i)
+
+    EMBEDDING_CACHE.labels("hit").inc(len(documents) - len(missing))
+    EMBEDDING_CACHE.labels("miss").inc(len(missing))
+
+    if missing:
+        new_vectors = get_embedding_model().encode(
+            [documents[i] for i in missing], show_progress_bar=False
+        ).astype(np.float32)
+        for i, vector in zip(missing, new_vectors):
+            embeddings[i] = vector
+
+        execute_values(
+            cur,
+            """
+            INSERT INTO EmailEmbeddings (email_id, user_email_address, model_name, text_hash, embedding)
+            VALUES %s
+            ON CONFLICT (email_id, model_name)
+            DO UPDATE SET text_hash = EXCLUDED.text_hash, embedding = EXCLUDED.embedding
+            """,
+            [
+                (email_ids[i], user_email, EMBEDDING_MODEL_NAME, hashes[i], to_vector_literal(vector))
+                for i, vector in zip(missing, new_vectors)
+            ],
+            template="(%s, %s, %s, %s, %s::vector)"
+        )
+        conn.commit()
+
+    if not embeddings:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(embeddings)
+
+def get_stored_embeddings(conn, email_ids: List[str], documents: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The STORED_EMBEDDING_MODEL vectors of the documents that have one, in order, and a
+    mask of the documents that don't (no stored vector, or one whose text hash no longer
+    matches). Nothing is embedded.
+    """
+    stored = _fetch_vectors(conn.cursor(), STORED_EMBEDDING_MODEL, email_ids)
+    conn.commit()
+    vectors = []
+    missing = np.zeros(len(documents), dtype=bool)
+    for i, (email_id, doc) in enumerate(zip(email_ids, documents)):
+        hit = stored.get(email_id)
+        if hit is None or (hit[0] is not None and hit[0] != text_hash(doc)):
+            missing[i] = True
+        else:
+            vectors.append(_parse_vector(hit[1]))
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32), missing
+    return np.vstack(vectors), missing
+
+def get_source_embeddings(conn, user_email: str, email_ids: List[str], documents: List[str]) -> Tuple[np.ndarray, str, np.ndarray]:
+    """
+    Embed documents from the configured EMBEDDING_SOURCE. Returns the vectors, the name
+    of the model whose vector space they are in, and a mask of the documents that have
+    no vector; the vectors are those of the other documents, in order.
+    With the "stored" source, vectors are bulk-loaded from EmailEmbeddings and nothing
+    is embedded on CPU. Vectors from two models can't be clustered together, so emails
+    without a usable stored vector are left out, as long as at least STORED_MIN_COVERAGE
+    of them have one; below that the whole batch falls back to the local model, through
+    its cache.
+    """
+    if EMBEDDING_SOURCE == "stored" and documents:
+        vectors, missing = get_stored_embeddings(conn, email_ids, documents)
+        if len(vectors) >= STORED_MIN_COVERAGE * len(documents):
+            if missing.any():
+                logger.info("Leaving out %d of %d emails without a usable %s vector", int(missing.sum()), len(documents), STORED_EMBEDDING_MODEL)
+            return vectors, STORED_EMBEDDING_MODEL, missing
+        logger.info(
+            "Only %d of %d emails have a usable %s vector, using %s",
+            len(vectors), len(documents), STORED_EMBEDDING_MODEL, EMBEDDING_MODEL_NAME
+        )
+
+    vectors = get_embeddings(conn, user_email, email_ids, documents)
+    return vectors, EMBEDDING_MODEL_NAME, np.zeros(len(documents), dtype=bool)
@@ -0,0 +1,154 @@
+import io
+import json
+from typing import List
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+
+from metrics import stage
+
+# Response formats for topic results, chosen by the Accept header.
+# Results are nested dicts whose tables are DataFrames:
+#   - application/json: the original shape. Tables become lists of records, except
+#     topic tables marked with attrs["orient"] = "dict", which keep DataFrame.to_dict()'s shape.
+#   - COLUMNAR_JSON / MSGPACK: every table is a dict of column arrays; categorical columns
+#     (topic names) are dictionary-encoded as {"dictionary": [...], "codes": [...]}.
+#   - ARROW_STREAM: the tables with an email_id column in one Arrow IPC stream, with a
+#     "section" column naming where each row came from; everything else is columnar JSON
+#     in the schema metadata under "result".
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.topics.columnar+json"
+MSGPACK = "application/msgpack"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# Formats needing an optional package, and the package to import
+OPTIONAL_FORMATS = {MSGPACK: "msgpack", ARROW_STREAM: "pyarrow"}
+
+def available_formats() -> List[str]:
+    """Media types this process can produce; the optional ones only if their package is installed."""
+    formats = [JSON, COLUMNAR_JSON]
+    for media_type, module in OPTIONAL_FORMATS.items():
+        try:
+            __import__(module)
+            formats.append(media_type)
+        except ImportError:
+            pass
+    return formats
+
+def negotiate(request: Request) -> str:
+    """Pick the response media type from the Accept header (JSON by default); 406 if none can be produced."""
+    accept = request.headers.get("accept")
+    if not accept:
+        return JSON
+    available = available_formats()
+    choices = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            choices.append((-quality, position, media_type))
+    for _, _, media_type in sorted(choices):
+        if media_type in ("*/*", "application/*"):
+            return JSON
+        if media_type in available:
+            return media_type
+    raise HTTPException(status_code=406, detail=f"Acceptable formats: {', '.join(available)}")
+
+def _column(series: pd.Series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return {"dictionary": series.cat.categories.tolist(), "codes": series.cat.codes.tolist()}
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return [None if pd.isna(value) else value.isoformat() for value in series]
+    return series.tolist()
+
+def _columnar(value):
+    """The result with every table as a dict of column arrays, ready for JSON or MessagePack."""
+    if isinstance(value, pd.DataFrame):
+        return {name: _column(value[name]) for name in value.columns}
+    if isinstance(value, dict):
+        return {key: _columnar(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_columnar(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _json(value) -> str:
+    """The original JSON shape, with tables written by pandas' C encoder rather than one dict per row."""
+    if isinstance(value, pd.DataFrame):
+        orient = "columns" if value.attrs.get("orient") == "dict" else "records"
+        return value.to_json(orient=orient, date_format="iso", force_ascii=False)
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{json.dumps(str(key))}:{_json(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_json(item) for item in value) + "]"
+    return json.dumps(jsonable_encoder(value))
+
+def _email_tables(value, path: str, tables: list):
+    """Move the tables with an email_id column out of value into tables, as (section, frame)."""
+    if isinstance(value, dict):
+        rest = {}
+        for key, item in value.items():
+            section = f"{path}.{key}" if path else str(key)
+            if isinstance(item, pd.DataFrame) and "email_id" in item.columns:
+                tables.append((section, item))
+            else:
+                rest[key] = _email_tables(item, section, tables)
+        return rest
+    return value
+
+def _nullable_ints(frame: pd.DataFrame) -> pd.DataFrame:
+    ints = [name for name in frame.columns if pd.api.types.is_integer_dtype(frame[name].dtype)]
+    return frame.astype({name: pd.Int64Dtype() for name in ints}) if ints else frame
+
+def _arrow(result) -> bytes:
+    import pyarrow as pa
+
+    tables = []
+    rest = _email_tables(result, "", tables)
+    if tables:
+        # Integer columns become nullable first, so rows from sections without them get nulls
+        # instead of turning e.g. group_id into a float column of NaN
+        frame = pd.concat([_nullable_ints(table).assign(section=section) for section, table in tables], ignore_index=True)
+        for column in ("section", "topic_name"):
+            if column in frame.columns:
+                frame[column] = frame[column].astype("category")
+    else:
+        frame = pd.DataFrame({"email_id": pd.Series([], dtype=object)})
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({"result": json.dumps(_columnar(rest), default=str)})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def render(result, media_type: str) -> bytes:
+    """Serialize a result in one of the negotiated formats."""
+    with stage("serialize"):
+        return _render(result, media_type)
+
+def _render(result, media_type: str) -> bytes:
+    if media_type == JSON:
+        return _json(result).encode("utf-8")
+    if media_type == COLUMNAR_JSON:
+        return json.dumps(_columnar(result), default=str).encode("utf-8")
+    if media_type == MSGPACK:
+        import msgpack
+        return msgpack.packb(_columnar(result), use_bin_type=True, default=str)
+    if media_type == ARROW_STREAM:
+        return _arrow(result)
+    raise ValueError(f"Unknown media type: {media_type}")
+
+def topic_table(topic_info: pd.DataFrame) -> pd.DataFrame:
+    """Mark a topic-info table to keep DataFrame.to_dict()'s shape in the default JSON format."""
+    topic_info = topic_info.reset_index(drop=True)
+    topic_info.attrs["orient"] = "dict"
+    return topic_info
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Optional
+
+from fastapi import HTTPException
+
+from compute import CORE_BUDGET, thread_allotment
+from metrics import JOB_SECONDS, start_trace
+
+logger = logging.getLogger(__name__)
+
+# Modeling jobs that may run at the same time; more are queued. One allotment of the core
+# budget is kept for /assign_topics, which embeds on request threads, so at most budget - 1.
+JOB_WORKERS = max(1, min(int(os.environ.get("TOPIC_JOB_WORKERS", 2)), CORE_BUDGET - 1))
+# Threads each running job (and the /assign_topics allotment) may use for UMAP, HDBSCAN,
+# BLAS and torch: its share of the core budget, never more
+_SHARE = max(1, CORE_BUDGET // (JOB_WORKERS + 1))
+JOB_THREADS = max(1, min(int(os.environ.get("TOPIC_JOB_THREADS", _SHARE)), _SHARE))
+# /assign_topics requests that may embed at once, JOB_THREADS threads each, in what the jobs leave of the budget
+REQUEST_SLOTS = max(1, (CORE_BUDGET - JOB_WORKERS * JOB_THREADS) // JOB_THREADS)
+# Queued + running jobs accepted before new submissions are rejected with 503
+JOB_QUEUE_LIMIT = int(os.environ.get("TOPIC_JOB_QUEUE_LIMIT", 100))
+# How long finished jobs stay pollable, in seconds
+JOB_TTL = int(os.environ.get("TOPIC_JOB_TTL", 3600))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="topic-job")
+_jobs: Dict[str, dict] = {}
+_active: Dict[Hashable, str] = {}  # single-flight key -> id of the queued/running job
+# Jobs rewrite the user's artifacts and stored topics, so they run one at a time per user:
+# user -> jobs waiting for that user's running job, which submits the next one when it ends
+_user_queues: Dict[str, deque] = {}
+_lock = threading.Lock()
+# Requests embedding outside the job pool share the part of the budget kept for them
+_request_slots = threading.BoundedSemaphore(REQUEST_SLOTS)
+
+def _prune_finished_jobs():
+    cutoff = time.time() - JOB_TTL
+    for job_id in [job_id for job_id, job in _jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+        del _jobs[job_id]
+
+def submit_job(kind: str, user_email: str, fn: Callable, *args, key: Optional[Hashable] = None) -> dict:
+    """
+    Queue fn(*args, progress=...) on the job pool and return its job record.
+    A user's jobs run one after another, in submission order.
+    Submissions sharing a key (by default kind + user_email) while a job is
+    queued or running are coalesced into that job instead of starting another.
+    """
+    flight_key = key if key is not None else (kind, user_email)
+    with _lock:
+        job_id = _active.get(flight_key)
+        if job_id is not None:
+            return _jobs[job_id]
+
+        _prune_finished_jobs()
+        if len(_active) >= JOB_QUEUE_LIMIT:
+            raise HTTPException(status_code=503, detail="Too many clustering jobs queued, try again later.")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "user_email": user_email,
+            "status": "queued",
+            "progress": None,
+            "result": None,
+            "error": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "trace": None
+        }
+        _jobs[job["job_id"]] = job
+        _active[flight_key] = job["job_id"]
+
+        if user_email in _user_queues:
+            _user_queues[user_email].append((job, flight_key, fn, args))
+            return job
+        _user_queues[user_email] = deque()
+
+    _executor.submit(_run_job, job, flight_key, fn, args)
+    return job
+
+def _run_job(job: dict, flight_key: Hashable, fn: Callable, args: tuple):
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    trace = start_trace(job["kind"])
+
+    def progress(stage: str):
+        job["progress"] = stage
+
+    try:
+        with thread_allotment(JOB_THREADS):
+            job["result"] = fn(*args, progress=progress)
+        job["status"] = "succeeded"
+    except HTTPException as e:
+        job["error"] = {"status_code": e.status_code, "detail": e.detail}
+        job["status"] = "failed"
+    except Exception as e:
+        logger.exception("Job %s (%s for %s) failed", job["job_id"], job["kind"], job["user_email"])
+        job["error"] = {"status_code": 500, "detail": str(e)}
+        job["status"] = "failed"
+    finally:
+        job["finished_at"] = time.time()
+        job["trace"] = trace.to_dict()
+        JOB_SECONDS.labels(job["kind"], job["status"]).observe(job["finished_at"] - job["started_at"])
+        with _lock:
+            _active.pop(flight_key, None)
+            waiting = _user_queues[job["user_email"]]
+            if waiting:
+                _executor.submit(_run_job, *waiting.popleft())
+            else:
+                del _user_queues[job["user_email"]]
+
+@contextmanager
+def request_allotment():
+    """
+    Run a synchronous request's model work (the /assign_topics embedding) in the part of
+    the core budget kept for requests, REQUEST_SLOTS requests at a time.
+    """
+    with _request_slots, thread_allotment(JOB_THREADS):
+        yield
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Look up a job by id; finished jobs are kept for JOB_TTL seconds."""
+    return _jobs.get(job_id)
+
+def job_summary(job: dict) -> dict:
+    """The job record without its (possibly large) result."""
+    summary = {k: v for k, v in job.items() if k != "result"}
+    summary["status_url"] = f"/jobs/{job['job_id']}"
+    return summary
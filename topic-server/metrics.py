@@ -0,0 +1,173 @@
+import contextvars
+import functools
+import resource
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, REGISTRY
+
+# Prometheus metrics for the topic server, plus per-request/per-job traces.
+# Label values are kept to pipeline and stage names; per-user numbers go into traces
+# (Server-Timing headers and job records) instead of labels.
+
+# Requests carrying this header get a Server-Timing header with their stages
+TRACE_HEADER = "X-Topic-Trace"
+
+STAGE_SECONDS = Histogram(
+    "topic_stage_seconds", "Wall time of one pipeline stage",
+    ["pipeline", "stage"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+STAGE_RSS_DELTA = Histogram(
+    "topic_stage_peak_rss_delta_bytes", "Growth of the process's peak RSS during one pipeline stage",
+    ["pipeline", "stage"],
+    buckets=(0, 1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9, 2e9, 4e9)
+)
+DOCUMENTS = Histogram(
+    "topic_documents", "Documents per user handled by one pipeline run",
+    ["pipeline"],
+    buckets=(10, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+)
+POOL_WAIT_SECONDS = Histogram(
+    "topic_db_pool_wait_seconds", "Time spent waiting for a pooled database connection",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10)
+)
+EMBEDDING_CACHE = Counter(
+    "topic_embedding_cache_total", "Embedding cache lookups in EmailEmbeddings",
+    ["result"]
+)
+JOB_SECONDS = Histogram(
+    "topic_job_seconds", "Run time of a modeling job",
+    ["kind", "status"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+class CacheStatsCollector:
+    """Exposes the in-process model and response cache counters."""
+    def describe(self):
+        # Registering would otherwise call collect() while this module is still importing
+        return []
+
+    def collect(self):
+        # Imported here: the caches render responses, which records metrics
+        import model_cache
+        import response_cache
+        for name, stats in (("model", model_cache.stats), ("response", response_cache.stats)):
+            family = CounterMetricFamily(f"topic_{name}_cache", f"{name.capitalize()} cache events", labels=["event"])
+            for event, count in stats.items():
+                family.add_metric([event], count)
+            yield family
+
+REGISTRY.register(CacheStatsCollector())
+
+class Trace:
+    """Stages recorded for one request or job, in order."""
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self.stages: List[Dict] = []
+        self.documents: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return {"pipeline": self.pipeline, "documents": self.documents, "stages": self.stages}
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("topic_trace", default=None)
+
+def start_trace(pipeline: str) -> Trace:
+    """Make a new trace current for this thread/task; stages recorded afterwards land in it."""
+    trace = Trace(pipeline)
+    _current_trace.set(trace)
+    return trace
+
+def _peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kilobytes on Linux
+
+def observe_stage(name: str, seconds: float, rss_delta: int = 0, pipeline: Optional[str] = None):
+    """Record a finished stage, e.g. one timed in a fit worker process."""
+    trace = _current_trace.get()
+    pipeline = pipeline or (trace.pipeline if trace is not None else "request")
+    STAGE_SECONDS.labels(pipeline, name).observe(seconds)
+    STAGE_RSS_DELTA.labels(pipeline, name).observe(rss_delta)
+    if trace is not None:
+        trace.stages.append({"stage": name, "seconds": round(seconds, 4), "peak_rss_delta_bytes": rss_delta})
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage. Peak RSS is process-wide, so with concurrent jobs the
+    delta is an upper bound on what this stage allocated.
+    """
+    rss_before = _peak_rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start, _peak_rss_bytes() - rss_before)
+
+def timed(name: str):
+    """Decorator timing every call of a function as a stage."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument_model(topic_model):
+    """
+    Time the reducer, the clusterer and the c-TF-IDF computation inside a BERTopic fit
+    as the "reduce", "cluster" and "ctfidf" stages.
+    """
+    for model, name, methods in (
+        (topic_model.umap_model, "reduce", ("fit", "transform")),
+        (topic_model.hdbscan_model, "cluster", ("fit", "predict")),
+        (topic_model, "ctfidf", ("_c_tf_idf",))
+    ):
+        for method in methods:
+            if hasattr(model, method):
+                original = getattr(model, method)
+                def timed(*args, _original=original, _name=name, **kwargs):
+                    with stage(_name):
+                        return _original(*args, **kwargs)
+                # Set on the instance so BERTopic's isinstance checks still see the real class
+                setattr(model, method, timed)
+    return topic_model
+
+def observe_documents(count: int):
+    """Record how many documents the current pipeline run handles."""
+    trace = _current_trace.get()
+    DOCUMENTS.labels(trace.pipeline if trace is not None else "request").observe(count)
+    if trace is not None:
+        trace.documents = count
+
+def server_timing(trace: dict, total: Optional[float] = None) -> str:
+    """A Server-Timing header value for a trace (durations in milliseconds)."""
+    entries = [f"{s['stage']};dur={s['seconds'] * 1000:.1f}" for s in trace["stages"]]
+    if trace.get("documents") is not None:
+        entries.append(f'documents;desc="{trace["documents"]}"')
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+async def trace_requests(request: Request, call_next):
+    """
+    HTTP middleware tracing every request under its first path segment (so /jobs/<id>
+    is "jobs"); requests sending X-Topic-Trace get their stages back in Server-Timing.
+    """
+    trace = start_trace(request.url.path.strip("/").split("/")[0] or "root")
+    response = await call_next(request)
+    if TRACE_HEADER.lower() in request.headers and "server-timing" not in response.headers:
+        response.headers["Server-Timing"] = server_timing(trace.to_dict(), time.perf_counter() - trace.started)
+    return response
+
+router = APIRouter()
+
+@router.get("/metrics")
+def get_metrics():
+    """Prometheus metrics for this process."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+# Upper bound on the (on-disk) size of models kept in memory, in bytes
+MODEL_CACHE_BYTES = int(os.environ.get("TOPIC_MODEL_CACHE_BYTES", 2 * 1024 ** 3))
+
+# model path -> (model, size in bytes, mtime of the file or directory it was loaded from)
+_models: "OrderedDict[str, tuple]" = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _evict(model_file: str):
+    global _total_bytes
+    _, size, _ = _models.pop(model_file)
+    _total_bytes -= size
+
+def _path_mtime(path: str) -> int:
+    """
+    One stat telling whether a model was rewritten: the file's mtime, or for a model
+    directory the directory's own, which changes whenever a file in it is created,
+    renamed over or removed (every artifact write swaps in a new manifest).
+    """
+    return os.stat(path).st_mtime_ns
+
+def _path_size(path: str) -> int:
+    """Size of a model file, or of all files in a model directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def put_model(model_file: str, model, mtime: int = None):
+    """
+    Cache a model under its path, evicting least recently used entries over budget.
+    mtime is that of the files the model was loaded from, if taken before loading.
+    """
+    global _total_bytes
+    if mtime is None:
+        mtime = _path_mtime(model_file)
+    size = _path_size(model_file)
+    with _lock:
+        if model_file in _models:
+            _evict(model_file)
+        if size > MODEL_CACHE_BYTES:
+            return
+        while _models and _total_bytes + size > MODEL_CACHE_BYTES:
+            _evict(next(iter(_models)))
+            stats["evictions"] += 1
+        _models[model_file] = (model, size, mtime)
+        _total_bytes += size
+
+def load_model(model_file: str, loader: Callable):
+    """
+    Return the model saved at model_file, calling loader(model_file) only on a miss.
+    Entries are keyed by path (one per user, or per user and window) and are
+    reloaded if the files were rewritten since they were cached, e.g. by a fit worker.
+    The file system is only touched outside the lock.
+    """
+    mtime = _path_mtime(model_file)
+    with _lock:
+        entry = _models.get(model_file)
+        if entry is not None and entry[2] == mtime:
+            _models.move_to_end(model_file)
+            stats["hits"] += 1
+            return entry[0]
+        stats["misses"] += 1
+
+    model = loader(model_file)
+    put_model(model_file, model, mtime)
+    return model
+
+def invalidate(model_file: str):
+    """Drop a cached model, e.g. after its file was replaced elsewhere."""
+    with _lock:
+        if model_file in _models:
+            _evict(model_file)
@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from bertopic import BERTopic
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.feature_extraction.text import CountVectorizer
+from umap import UMAP
+import hdbscan
+from artifacts import save_artifact
+from compute import CORE_BUDGET, allotted_threads, limit_process_threads, thread_allotment
+from metrics import instrument_model, stage, start_trace
+
+# Number of processes used to fit the /topics_incremental windows concurrently
+FIT_WORKERS = int(os.environ.get("TOPIC_FIT_WORKERS", min(4, CORE_BUDGET)))
+
+# Reducer/clusterer pair used when a model config doesn't name one (see BACKENDS)
+TOPIC_BACKEND = os.environ.get("TOPIC_BACKEND", "quality")
+
+# Settings for the PCA-based backends; a config can override them under "pca" / "kmeans"
+PCA_DEFAULTS = {"n_components": 10}
+KMEANS_DEFAULTS = {"n_clusters": None, "batch_size": 1024}
+# Above this many documents PCA is fit in batches with IncrementalPCA to bound memory
+INCREMENTAL_PCA_ABOVE = 50000
+
+# Model settings for the whole-mailbox /topics and /update_topics models
+TOPICS_CONFIG = {
+    "custom_stopwords": ["the", "and", "to", "for", "of", "a", "in", "on", "email", "summary", "error", "generating", ""],
+    "umap": {"n_neighbors": 10, "min_dist": 0.1},
+    "hdbscan": {"min_cluster_size": 7},
+    "nr_topics": "auto"
+}
+
+_fit_executor = None
+_fit_executor_lock = threading.Lock()
+
+def get_fit_executor() -> ProcessPoolExecutor:
+    """
+    Return the shared process pool for model fits, creating it on first use.
+    Workers are spawned rather than forked so they don't inherit torch/OpenMP thread state.
+    """
+    global _fit_executor
+    # Job threads call this concurrently; without the lock two of them could each create a pool
+    with _fit_executor_lock:
+        if _fit_executor is None:
+            _fit_executor = ProcessPoolExecutor(
+                max_workers=FIT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _fit_executor
+
+def _pca(config: dict, n_documents: int):
+    settings = {**PCA_DEFAULTS, **config.get("pca", {})}
+    n_components = max(1, min(settings["n_components"], n_documents))
+    if n_documents > INCREMENTAL_PCA_ABOVE:
+        return IncrementalPCA(n_components=n_components)
+    return PCA(n_components=n_components, svd_solver="randomized", random_state=42)
+
+def _hdbscan(config: dict):
+    # HDBSCAN's core distances run on joblib, which would otherwise take 4 workers whatever the allotment
+    return hdbscan.HDBSCAN(**{"core_dist_n_jobs": allotted_threads(), **config["hdbscan"]})
+
+def _quality_backend(config: dict, n_documents: int):
+    """UMAP + HDBSCAN: the best topics, but UMAP dominates fit time on large mailboxes."""
+    return UMAP(**{"n_jobs": allotted_threads(), **config["umap"]}), _hdbscan(config)
+
+def _balanced_backend(config: dict, n_documents: int):
+    """PCA + HDBSCAN: keeps density clustering and outliers, without the UMAP fit."""
+    return _pca(config, n_documents), _hdbscan(config)
+
+def _fast_backend(config: dict, n_documents: int):
+    """PCA + MiniBatchKMeans: near-linear in mailbox size; every email gets a topic (no outliers)."""
+    settings = {**KMEANS_DEFAULTS, **config.get("kmeans", {})}
+    n_clusters = settings["n_clusters"] or int(np.clip(np.sqrt(n_documents / 2), 2, 100))
+    clusterer = MiniBatchKMeans(
+        n_clusters=max(1, min(n_clusters, n_documents)),
+        batch_size=settings["batch_size"],
+        n_init=3,
+        random_state=42
+    )
+    return _pca(config, n_documents), clusterer
+
+# Backend name -> function building the (reducer, clusterer) pair handed to BERTopic
+BACKENDS = {
+    "quality": _quality_backend,
+    "balanced": _balanced_backend,
+    "fast": _fast_backend
+}
+
+def build_topic_model(config: dict, embedding_model=None, n_documents: int = 0) -> BERTopic:
+    """
+    Build an unfitted BERTopic model from a model config.
+    config["backend"] (default TOPIC_BACKEND) picks the dimensionality reducer and clusterer;
+    n_documents sizes the PCA-based backends. UMAP and HDBSCAN use the calling thread's
+    allotment of the core budget (compute.allotted_threads).
+    """
+    backend = config.get("backend", TOPIC_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown topic backend: {backend}")
+    umap_model, hdbscan_model = BACKENDS[backend](config, n_documents)
+    vectorizer_model = CountVectorizer(stop_words=config["custom_stopwords"])
+    return BERTopic(
+        embedding_model=embedding_model,
+        vectorizer_model=vectorizer_model,
+        umap_model=umap_model,
+        hdbscan_model=hdbscan_model,
+        nr_topics=config["nr_topics"],
+        low_memory=False  # Ensure all data is used
+    )
+
+def fit_window(documents: list, embeddings: np.ndarray, config: dict, model_path: str, embedding_model_name: str, threads: int = 1):
+    """
+    Fit a BERTopic model for one time window on precomputed embeddings and save its slim artifact.
+    Runs inside a pool worker, so it returns the topic assignments, topic info and
+    (stage, seconds, peak RSS delta) timings instead of the (large) model itself;
+    metrics recorded in the worker process would never reach /metrics.
+    The fit uses `threads` threads: the submitting job's allotment, or its share of it.
+    """
+    # A pool worker runs one fit at a time, so its process-wide pools can follow each fit's allotment
+    limit_process_threads(threads)
+    trace = start_trace("fit_window")
+    with thread_allotment(threads):
+        topic_model = instrument_model(build_topic_model(config, n_documents=len(documents)))
+        with stage("fit"):
+            topics, _ = topic_model.fit_transform(documents, embeddings)
+    with stage("save_artifact"):
+        save_artifact(topic_model, model_path, embedding_model_name, documents, topics)
+    topic_info: pd.DataFrame = topic_model.get_topic_info()
+    stages = [(s["stage"], s["seconds"], s["peak_rss_delta_bytes"]) for s in trace.stages]
+    return topics, topic_info, stages
@@ -0,0 +1,835 @@
+import io
+import logging
+import os
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+
+from artifacts import (
+    artifact_exists,
+    artifact_path,
+    artifact_stamp,
+    assign_topics,
+    document_term_counts,
+    load_artifact,
+    save_artifact,
+    slice_artifact,
+    update_artifact
+)
+from centroids import centroid_model, nearest_topics, save_centroids
+from compute import allotted_threads
+from db import get_db_connection, release_db_connection
+from dedup import collapse_near_duplicates
+from embeddings import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_SOURCE,
+    STORED_EMBEDDING_MODEL,
+    get_embedding_model,
+    get_embeddings,
+    get_source_embeddings,
+    get_stored_embeddings
+)
+from formats import topic_table
+from metrics import instrument_model, observe_documents, observe_stage, stage, timed
+from model_cache import invalidate, load_model
+from response_cache import invalidate_user
+from sampling import ASSIGN_BATCH_SIZE, stratified_sample
+from watermarks import (
+    clear_watermark,
+    fetch_stored_assignments,
+    load_watermark,
+    read_mailbox_summary,
+    read_mailbox_watermark,
+    save_watermark
+)
+
+# The modeling pipeline behind /topics, /topics_incremental and /update_topics.
+# bertopic, umap and hdbscan live in modeling.py and are only imported once a
+# model actually has to be fit.
+
+logger = logging.getLogger(__name__)
+
+# Rows pulled per round trip when streaming a mailbox out of Postgres
+FETCH_BATCH_SIZE = int(os.environ.get("TOPIC_FETCH_BATCH_SIZE", 2000))
+# Rows sent per COPY chunk when storing topic assignments
+STORE_CHUNK_ROWS = int(os.environ.get("TOPIC_STORE_CHUNK_ROWS", 10000))
+
+# Centroid similarity below which a document assigned to an existing model counts as an outlier
+# (/update_topics, /assign_topics and the /topics assignment of unsampled or unchanged mailboxes)
+UPDATE_MIN_SIMILARITY = float(os.environ.get("TOPIC_UPDATE_MIN_SIMILARITY", 0.3))
+# Outlier rate among documents added since the last fit that triggers a full refit
+UPDATE_MAX_OUTLIER_RATE = float(os.environ.get("TOPIC_UPDATE_MAX_OUTLIER_RATE", 0.3))
+# Documents added since the last fit needed before the outlier rate is trusted
+UPDATE_MIN_DOCS = int(os.environ.get("TOPIC_UPDATE_MIN_DOCS", 20))
+# Documents added since the last fit, relative to the fitted mailbox, that triggers a full refit
+UPDATE_MAX_GROWTH = float(os.environ.get("TOPIC_UPDATE_MAX_GROWTH", 0.5))
+
+# /topics_incremental windows that get their own topic model, with their lookback in days
+MODEL_TIME_WINDOWS = [
+    ("3_months", 90),
+    ("6_months", 180),
+    ("1_year", 365),
+    ("3_years", 1095)
+]
+
+# "hierarchical" fits only the longest /topics_incremental window and derives the shorter
+# windows' topics from it; "independent" fits a model per window with its own MODEL_CONFIGS entry
+INCREMENTAL_MODE = os.environ.get("TOPIC_INCREMENTAL_MODE", "hierarchical")
+
+# Model settings for each /topics_incremental window (customize as needed).
+# "backend" picks the reducer/clusterer (see modeling.BACKENDS); windows without one use TOPIC_BACKEND.
+MODEL_CONFIGS = {
+    "3_months": {
+        "custom_stopwords": ["the", "and", "to", "for", "of", "a", "in", "on", "email"],
+        "umap": {"n_neighbors": 15, "min_dist": 0.2},
+        "hdbscan": {"min_cluster_size": 5},
+        "nr_topics": "auto"
+    },
+    "6_months": {
+        "custom_stopwords": ["the", "and", "to", "for", "of", "a", "in", "on", "email"],
+        "umap": {"n_neighbors": 20, "min_dist": 0.15},
+        "hdbscan": {"min_cluster_size": 4},
+        "nr_topics": "auto"
+    },
+    "1_year": {
+        "custom_stopwords": ["the", "and", "to", "for", "of", "a", "in", "on", "email"],
+        "umap": {"n_neighbors": 25, "min_dist": 0.1},
+        "hdbscan": {"min_cluster_size": 6},
+        "nr_topics": "auto"
+    },
+    "3_years": {
+        "custom_stopwords": ["the", "and", "to", "for", "of", "a", "in", "on", "email"],
+        "umap": {"n_neighbors": 30, "min_dist": 0.05},
+        "hdbscan": {"min_cluster_size": 8},
+        "nr_topics": "auto"
+    }
+}
+
+def preload_modeling():
+    """Import the modeling stack and load the embedding model up front (used by the worker at startup)."""
+    import modeling  # noqa: F401
+    get_embedding_model()
+
+@timed("model_load")
+def load_topic_artifact(model_path: str) -> dict:
+    """Open a saved topic artifact through the in-process model cache."""
+    return load_model(model_path, load_artifact)
+
+def save_topic_artifact(topic_model, model_path: str, embedding_model_name: str, documents: List[str], topics: List[int]) -> dict:
+    """Save a fitted model's slim artifact and return it as cached for later requests."""
+    invalidate(model_path)
+    save_artifact(topic_model, model_path, embedding_model_name, documents, topics)
+    return load_topic_artifact(model_path)
+
+@timed("embed")
+def load_embeddings(user_email: str, email_ids: List[str], documents: List[str]) -> Tuple[np.ndarray, str, np.ndarray]:
+    """
+    Embed documents from EMBEDDING_SOURCE; also returns the name of the embedding model
+    used and a mask of the documents left without a vector (see get_source_embeddings).
+    """
+    conn = get_db_connection()
+    try:
+        return get_source_embeddings(conn, user_email, email_ids, documents)
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        release_db_connection(conn)
+
+@timed("embed")
+def load_local_embeddings(user_email: str, email_ids: List[str], documents: List[str]) -> np.ndarray:
+    """Embed documents with the local EMBEDDING_MODEL (through its cache), whatever EMBEDDING_SOURCE says."""
+    conn = get_db_connection()
+    try:
+        return get_embeddings(conn, user_email, email_ids, documents)
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        release_db_connection(conn)
+
+@timed("embed")
+def load_stored_embeddings(email_ids: List[str], documents: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stored STORED_EMBEDDING_MODEL vectors of the documents that have one, and a mask of those that don't."""
+    conn = get_db_connection()
+    try:
+        return get_stored_embeddings(conn, email_ids, documents)
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        release_db_connection(conn)
+
+@timed("fetch")
+def fetch_user_emails(user_email: str) -> Dict[str, np.ndarray]:
+    """
+    Fetch all emails for the given user from the Emails table,
+    ensuring that no implicit limit is imposed.
+
+    Rows are streamed through a server-side cursor in batches of FETCH_BATCH_SIZE
+    and returned as columns ("email_id", "email_text", "date_sent", "sender_email") rather than
+    one dict per row, so they can back a DataFrame without another copy.
+    """
+    id_batches, text_batches, date_batches, sender_batches = [], [], [], []
+    conn = get_db_connection()
+    try:
+        # A named cursor keeps the result set on the server until we fetch it
+        cur = conn.cursor(name="fetch_user_emails")
+        cur.itersize = FETCH_BATCH_SIZE
+        cur.execute(
+            """
+            SELECT email_id,
+                   btrim(coalesce(subj, '') || ' ' || coalesce(summary, ''), E' \t\r\n') AS email_text,
+                   date_sent,
+                   sender_email
+            FROM Emails
+            WHERE user_email_address = %s
+            ORDER BY date_sent DESC
+            """,
+            (user_email,)
+        )
+        while True:
+            rows = cur.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            email_ids, email_texts, dates_sent, senders = zip(*rows)
+            id_batches.append(np.array(email_ids, dtype=object))
+            text_batches.append(np.array(email_texts, dtype=object))
+            date_batches.append(np.array(dates_sent, dtype="datetime64[us]"))
+            sender_batches.append(np.array(senders, dtype=object))
+        cur.close()
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+    emails = {
+        "email_id": np.concatenate(id_batches) if id_batches else np.empty(0, dtype=object),
+        "email_text": np.concatenate(text_batches) if text_batches else np.empty(0, dtype=object),
+        "date_sent": np.concatenate(date_batches) if date_batches else np.empty(0, dtype="datetime64[us]"),
+        "sender_email": np.concatenate(sender_batches) if sender_batches else np.empty(0, dtype=object)
+    }
+
+    return emails
+
+def label_topics(topics, topic_info: pd.DataFrame) -> Tuple[np.ndarray, pd.Categorical]:
+    """
+    Group ids and topic names for a list of topic assignments, joining names on topic id
+    in one vectorized lookup. Names are categorical, so each is stored once.
+    """
+    group_ids = np.asarray(topics, dtype=np.int64)
+    topic_ids = topic_info["Topic"].to_numpy(dtype=np.int64)
+    names = np.where(topic_ids == -1, "Outlier", topic_info["Name"].to_numpy(dtype=object))
+    if -1 not in topic_ids:
+        topic_ids, names = np.append(topic_ids, -1), np.append(names, "Outlier")
+
+    rows = pd.Index(topic_ids).get_indexer(group_ids)
+    unknown = rows == -1
+    if unknown.any():
+        # Topics missing from topic_info get a placeholder name
+        missing = np.unique(group_ids[unknown])
+        rows[unknown] = len(names) + np.searchsorted(missing, group_ids[unknown])
+        names = np.append(names, [f"Topic {tid}" for tid in missing])
+
+    categories, codes = np.unique(names.astype(str), return_inverse=True)
+    return group_ids, pd.Categorical.from_codes(codes[rows], categories=categories)
+
+def topic_centroids(artifact: dict) -> Tuple[str, List[int], List[str], np.ndarray]:
+    """(embedding model, topic ids, topic names, centroid vectors) of an artifact's real topics, for TopicCentroids."""
+    topic_info = artifact["topic_info"]
+    topic_ids = topic_info["Topic"].astype(int).to_numpy()
+    keep = topic_ids != -1
+    names = topic_info["Name"].to_numpy(dtype=object)[keep].tolist()
+    return artifact["embedding_model"], topic_ids[keep].tolist(), names, np.asarray(artifact["topic_embeddings"])[keep]
+
+@timed("store")
+def store_topics_in_db(user_email: str, email_df: pd.DataFrame, watermark: Optional[dict] = None, centroids: Optional[tuple] = None):
+    """
+    Store topics in the Groups and GroupEmail tables.
+    Assignments are streamed with COPY into a temporary staging table in chunks of
+    STORE_CHUNK_ROWS, then merged in the same transaction: the user's groups are
+    upserted on (user, group_id), and each staged email's existing model-written
+    GroupEmail rows (origin 'model') are replaced by its new assignment, so storing again
+    never duplicates an email. Rows the frontend added (origin 'user') are kept.
+    A watermark marks a whole-mailbox /topics result: it is saved in that transaction,
+    and all the user's model-written rows are replaced, so those stored under it are
+    exactly that result. Without one, the user's watermark is cleared, since the stored
+    assignments no longer match a /topics run.
+    centroids (see topic_centroids) replace the user's rows in TopicCentroids.
+    """
+    assignments = email_df[["group_id", "topic_name", "email_id"]]
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TEMP TABLE topic_assignments_stage (
+                group_id INT,
+                topic_name TEXT,
+                email_id TEXT
+            ) ON COMMIT DROP
+            """
+        )
+
+        for start in range(0, len(assignments), STORE_CHUNK_ROWS):
+            buffer = io.StringIO()
+            assignments.iloc[start:start + STORE_CHUNK_ROWS].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cur.copy_expert(
+                "COPY topic_assignments_stage (group_id, topic_name, email_id) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+
+        # GroupEmail has no unique key, so the emails' previous model assignments are deleted
+        # first; rows the frontend added (origin 'user') are left alone
+        if watermark is not None:
+            cur.execute("DELETE FROM GroupEmail WHERE user_email_address = %s AND origin = 'model'", (user_email,))
+        else:
+            cur.execute(
+                """
+                DELETE FROM GroupEmail ge
+                USING topic_assignments_stage s
+                WHERE ge.user_email_address = %s
+                  AND ge.origin = 'model'
+                  AND ge.email_id = s.email_id
+                """,
+                (user_email,)
+            )
+        cur.execute(
+            """
+            WITH upserted_groups AS (
+                INSERT INTO Groups (user_email_address, group_id, name)
+                SELECT DISTINCT ON (group_id) %s, group_id, topic_name
+                FROM topic_assignments_stage
+                ORDER BY group_id
+                ON CONFLICT (user_email_address, group_id) DO UPDATE SET name = EXCLUDED.name
+            )
+            INSERT INTO GroupEmail (user_email_address, group_id, email_id, origin)
+            SELECT %s, group_id, email_id, 'model'
+            FROM topic_assignments_stage
+            WHERE email_id IS NOT NULL
+            """,
+            (user_email, user_email)
+        )
+
+        if centroids is not None:
+            save_centroids(cur, user_email, *centroids)
+
+        if watermark is not None:
+            save_watermark(cur, user_email, watermark)
+        else:
+            clear_watermark(cur, user_email)
+        
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        release_db_connection(conn)
+    invalidate_user(user_email)
+
+def model_version(artifact: dict) -> str:
+    """Identifies the model behind a set of stored assignments, for the mailbox watermark."""
+    return f"{EMBEDDING_SOURCE}:{artifact['embedding_model']}:{artifact['version']}"
+
+@timed("watermark")
+def read_watermark(user_email: str) -> dict:
+    """Fingerprint the user's mailbox as it is now (see watermarks.read_mailbox_watermark)."""
+    conn = get_db_connection()
+    try:
+        watermark = read_mailbox_watermark(conn.cursor(), user_email)
+        conn.commit()
+        return watermark
+    finally:
+        release_db_connection(conn)
+
+@timed("mailbox_summary")
+def mailbox_summary(user_email: str) -> dict:
+    """Email count and latest date_sent of the user's mailbox (see watermarks.read_mailbox_summary)."""
+    conn = get_db_connection()
+    try:
+        summary = read_mailbox_summary(conn.cursor(), user_email)
+        conn.commit()
+        return summary
+    finally:
+        release_db_connection(conn)
+
+def response_version(user_email: str, endpoint: str, mailbox: dict) -> str:
+    """
+    Version of the /topics or /topics_incremental result for the mailbox described by
+    mailbox (mailbox_summary): the embedding source, the artifact stamp(s) and the
+    mailbox's email count and latest date. Nothing here reads a whole mailbox or artifact,
+    so it is cheap enough to compute on every request. /topics_incremental windows are
+    relative to today, so its version also carries the date.
+    """
+    if endpoint == "topics":
+        paths = [artifact_path(user_email)]
+    else:
+        paths = [artifact_path(user_email, label) for label, _ in MODEL_TIME_WINDOWS]
+    versions = [artifact_stamp(path) for path in paths]
+    if endpoint != "topics":
+        versions.append(date.today().isoformat())
+    return ":".join([EMBEDDING_SOURCE, *versions, str(mailbox["email_count"]), str(mailbox["max_date_sent"])])
+
+def load_unchanged_topics(user_email: str, watermark: dict, model_path: str) -> Optional[dict]:
+    """
+    The stored /topics result if neither the mailbox nor the model changed since it was
+    computed, read straight from Groups/GroupEmail; None if it has to be recomputed.
+    """
+    if not artifact_exists(model_path):
+        return None
+    try:
+        artifact = load_topic_artifact(model_path)
+    except Exception as e:
+        logger.warning("Error loading model %s: %s", model_path, e)
+        return None
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        if load_watermark(cur, user_email) != {**watermark, "model_version": model_version(artifact)}:
+            conn.commit()
+            return None
+        rows = fetch_stored_assignments(cur, user_email)
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+    # Model rows changed since by something that doesn't clear the watermark mean the
+    # stored rows are no longer the /topics result
+    if len(rows) != watermark["email_count"] or len({row[0] for row in rows}) != len(rows):
+        logger.warning("Stored assignments for %s don't match the watermark, recomputing", user_email)
+        return None
+    logger.info("Mailbox unchanged for %s, returning %d stored assignments", user_email, len(rows))
+    email_ids, group_ids, names = zip(*rows) if rows else ((), (), ())
+    return {
+        "topics": topic_table(artifact["topic_info"]),
+        "email_topics": pd.DataFrame({
+            "email_id": np.array(email_ids, dtype=object),
+            "group_id": np.array(group_ids, dtype=np.int64),
+            "topic_name": pd.Categorical(names)
+        })
+    }
+
+def assign_in_batches(user_email: str, artifact: dict, email_ids: List[str], documents: List[str], embed_locally: bool = False) -> Optional[np.ndarray]:
+    """
+    Assign documents to an artifact's nearest topic centroids, ASSIGN_BATCH_SIZE at a time
+    so only one batch of vectors is ever in memory; documents no centroid reaches
+    UPDATE_MIN_SIMILARITY for become outliers, as in /update_topics and /assign_topics.
+    Vectors come from the artifact's own embedding model: its stored vectors for an
+    artifact fitted on STORED_EMBEDDING_MODEL (emails without one are left as outliers),
+    otherwise the local model through its cache.
+    Returns None if EMBEDDING_SOURCE no longer embeds into the artifact's space (e.g. it
+    changed since the fit), so the caller can refit; embed_locally assigns in the
+    artifact's space regardless, for documents of the fit that just produced it.
+    """
+    model_name = artifact["embedding_model"]
+    source_model = STORED_EMBEDDING_MODEL if EMBEDDING_SOURCE == "stored" else EMBEDDING_MODEL_NAME
+    if model_name != source_model and not embed_locally:
+        return None
+
+    topics = np.full(len(documents), -1, dtype=np.int64)
+    for start in range(0, len(documents), ASSIGN_BATCH_SIZE):
+        stop = min(start + ASSIGN_BATCH_SIZE, len(documents))
+        if model_name == EMBEDDING_MODEL_NAME:
+            vectors = load_local_embeddings(user_email, email_ids[start:stop], documents[start:stop])
+            missing = np.zeros(stop - start, dtype=bool)
+        elif model_name == STORED_EMBEDDING_MODEL:
+            vectors, missing = load_stored_embeddings(email_ids[start:stop], documents[start:stop])
+        else:
+            vectors, missing = np.empty((0, 0), dtype=np.float32), np.ones(stop - start, dtype=bool)
+        if missing.any():
+            logger.info("No %s vectors for %d emails, leaving them as outliers", model_name, int(missing.sum()))
+        if len(vectors):
+            with stage("assign"):
+                topics[start:stop][~missing] = assign_topics(artifact, vectors, UPDATE_MIN_SIMILARITY)
+    return topics
+
+def compute_topics(
+    user_email: str,
+    refit: bool = False,
+    progress=lambda stage: None,
+    extra_documents: Optional[List[str]] = None,
+    reuse_artifact: bool = True
+):
+    """
+    Retrieve topics for a specific user by clustering emails.
+    Ensures **all emails** are retrieved, processed, and stored.
+    An existing topic artifact is reused for assignment unless refit is set, or unless
+    reuse_artifact is off, which refits a changed mailbox but still returns an unchanged
+    one's stored assignments (batch re-clustering).
+    If the mailbox watermark and model version match the last run, the stored
+    assignments are returned without fetching or embedding anything.
+    Near-duplicate emails are collapsed before embedding (see dedup.py) and take the
+    topic of a kept member of their group.
+    extra_documents (with refit, for /update_topics) are texts outside the mailbox that
+    are fitted along with it; their topics come back as "new_topics", one row per text.
+    They have no stored vectors, so such a fit is in the local model's space.
+    """
+    model_path = artifact_path(user_email)
+
+    # Taken before the fetch: mail arriving mid-run makes the saved watermark stale,
+    # which only costs a recompute on the next call
+    progress("checking for changes")
+    watermark = read_watermark(user_email)
+    if not refit:
+        stored = load_unchanged_topics(user_email, watermark, model_path)
+        if stored is not None:
+            return stored
+
+    progress("fetching")
+    emails = fetch_user_emails(user_email)
+    observe_documents(len(emails["email_id"]))
+    if len(emails["email_id"]) == 0:
+        raise HTTPException(status_code=404, detail="No emails found for this user.")
+    
+    documents = emails["email_text"].tolist()
+    email_ids = emails["email_id"].tolist()
+    # Only a few members of each near-duplicate group are embedded and clustered;
+    # source maps every email to the kept email whose topic it takes
+    with stage("dedup"):
+        kept, source = collapse_near_duplicates(documents)
+    if len(kept) < len(documents):
+        logger.info("Collapsed near-duplicates: clustering %d of %d emails", len(kept), len(documents))
+        documents = [documents[i] for i in kept]
+        email_ids = [email_ids[i] for i in kept]
+    artifact = None
+    if not refit and reuse_artifact and artifact_exists(model_path):
+        try:
+            artifact = load_topic_artifact(model_path)
+        except Exception as e:
+            logger.warning("Error loading model %s: %s", model_path, e)
+
+    topics = None
+    if artifact is not None:
+        progress("assigning")
+        # None if the mailbox embeds into another space than the artifact's centroids
+        topics = assign_in_batches(user_email, artifact, email_ids, documents)
+    if topics is None:
+        # Large mailboxes are fit on a stratified sample; the rest is assigned afterwards
+        fit_rows = stratified_sample(emails["date_sent"][kept], emails["sender_email"][kept])
+        fit_documents = [documents[i] for i in fit_rows]
+        if len(fit_rows) < len(documents):
+            logger.info("Fitting on a sample of %d of %d emails", len(fit_rows), len(documents))
+        progress("embedding")
+        if extra_documents:
+            embeddings = load_local_embeddings(user_email, [email_ids[i] for i in fit_rows], fit_documents)
+            embedding_model_name = EMBEDDING_MODEL_NAME
+            with stage("embed"):
+                extra_embeddings = get_embedding_model().encode(extra_documents, show_progress_bar=False).astype(np.float32)
+            embeddings = np.vstack([embeddings, extra_embeddings])
+            fit_documents = fit_documents + list(extra_documents)
+        else:
+            embeddings, embedding_model_name, missing = load_embeddings(user_email, [email_ids[i] for i in fit_rows], fit_documents)
+            if missing.any():
+                # Emails without a stored vector are assigned with the rest (as outliers)
+                fit_rows = fit_rows[~missing]
+                fit_documents = [documents[i] for i in fit_rows]
+
+        progress("clustering")
+        from modeling import TOPICS_CONFIG, build_topic_model
+        topic_model = instrument_model(build_topic_model(TOPICS_CONFIG, n_documents=len(fit_documents)))
+        with stage("fit"):
+            fit_topics, _ = topic_model.fit_transform(fit_documents, embeddings)
+        del embeddings
+        artifact = save_topic_artifact(topic_model, model_path, embedding_model_name, fit_documents, fit_topics)
+        del topic_model
+
+        fit_topics = np.asarray(fit_topics, dtype=np.int64)
+        topics = np.empty(len(documents), dtype=np.int64)
+        topics[fit_rows] = fit_topics[:len(fit_rows)]
+        extra_topics = fit_topics[len(fit_rows):]
+        rest = np.setdiff1d(np.arange(len(documents)), fit_rows)
+        if len(rest):
+            progress("assigning")
+            topics[rest] = assign_in_batches(
+                user_email, artifact, [email_ids[i] for i in rest], [documents[i] for i in rest], embed_locally=True
+            )
+    topic_info = artifact["topic_info"]
+
+    email_df = pd.DataFrame(emails, copy=False)
+    email_df["group_id"], email_df["topic_name"] = label_topics(topics[source], topic_info)
+
+    if "date_sent" in email_df.columns:
+        email_df = email_df.sort_values(by="date_sent", ascending=False)
+
+    progress("storing")
+    store_topics_in_db(
+        user_email, email_df,
+        watermark={**watermark, "model_version": model_version(artifact)},
+        centroids=topic_centroids(artifact)
+    )
+
+    result = {
+        "topics": topic_table(topic_info),
+        "email_topics": email_df[["email_id", "group_id", "topic_name"]].reset_index(drop=True)
+    }
+    if extra_documents:
+        group_ids, topic_names = label_topics(extra_topics, topic_info)
+        result["new_topics"] = pd.DataFrame({
+            "email_id": [None] * len(extra_documents),
+            "group_id": group_ids,
+            "topic_name": topic_names
+        })
+    return result
+
+def _window_mask(superset_df: pd.DataFrame, now: pd.Timestamp, days: int) -> np.ndarray:
+    return (superset_df["date_sent"] >= (now - pd.Timedelta(days=days))).to_numpy()
+
+def _independent_windows(user_email: str, superset_df: pd.DataFrame, superset_embeddings: np.ndarray, embedding_model_name: str, now: pd.Timestamp):
+    """
+    Fit a separate model for every /topics_incremental window, concurrently on the process pool.
+    Yields (label, window_df, topics, topic_info) per window, in MODEL_TIME_WINDOWS order.
+    """
+    from modeling import FIT_WORKERS, fit_window, get_fit_executor
+    executor = get_fit_executor()
+    # The windows fit side by side, so they split this job's allotment between them
+    threads = max(1, allotted_threads() // min(len(MODEL_TIME_WINDOWS), FIT_WORKERS))
+    futures = {}
+    window_dfs = {}
+    for label, days in MODEL_TIME_WINDOWS:
+        mask = _window_mask(superset_df, now, days)
+        window_df = superset_df[mask]
+        documents = window_df["email_text"].tolist()
+        if not documents:
+            logger.info("No emails found for window: %s", label)
+            continue
+
+        window_dfs[label] = window_df
+        futures[label] = executor.submit(
+            fit_window, documents, superset_embeddings[mask], MODEL_CONFIGS.get(label),
+            artifact_path(user_email, label), embedding_model_name, threads
+        )
+
+    for label, _ in MODEL_TIME_WINDOWS:
+        if label not in futures:
+            continue
+        topics, topic_info, stages = futures[label].result()
+        # Stages timed in the fit worker, recorded here under this job's trace
+        for stage_name, seconds, rss_delta in stages:
+            observe_stage(f"{label}.{stage_name}", seconds, rss_delta)
+        # The worker process rewrote the artifact, so any cached copy is stale
+        invalidate(artifact_path(user_email, label))
+        yield label, window_dfs[label], topics, topic_info
+
+def _hierarchical_windows(user_email: str, superset_df: pd.DataFrame, superset_embeddings: np.ndarray, embedding_model_name: str, now: pd.Timestamp):
+    """
+    Fit one model on the longest /topics_incremental window and derive the shorter ones from it:
+    each shorter window keeps its emails' assignments from that fit and gets its own c-TF-IDF,
+    names and centroids from its emails only (artifacts.slice_artifact). Costs about one fit,
+    and a topic id means the same topic in every window.
+    Yields (label, window_df, topics, topic_info) per window, in MODEL_TIME_WINDOWS order.
+    """
+    documents = superset_df["email_text"].tolist()
+    if not documents:
+        logger.info("No emails found for any window")
+        return
+
+    from modeling import fit_window, get_fit_executor
+    longest_label = max(MODEL_TIME_WINDOWS, key=lambda window: window[1])[0]
+    longest_path = artifact_path(user_email, longest_label)
+    topics, topic_info, stages = get_fit_executor().submit(
+        fit_window, documents, superset_embeddings, MODEL_CONFIGS.get(longest_label),
+        longest_path, embedding_model_name, allotted_threads()
+    ).result()
+    for stage_name, seconds, rss_delta in stages:
+        observe_stage(f"{longest_label}.{stage_name}", seconds, rss_delta)
+    invalidate(longest_path)
+    topics = np.asarray(topics, dtype=np.int64)
+
+    parent = load_topic_artifact(longest_path)
+    with stage("term_counts"):
+        doc_term_counts = document_term_counts(parent, documents)
+
+    for label, days in MODEL_TIME_WINDOWS:
+        if label == longest_label:
+            yield label, superset_df, topics, topic_info
+            continue
+        mask = _window_mask(superset_df, now, days)
+        if not mask.any():
+            logger.info("No emails found for window: %s", label)
+            continue
+        model_path = artifact_path(user_email, label)
+        with stage(f"{label}.slice"):
+            window_info = slice_artifact(model_path, parent, topics[mask], doc_term_counts[mask], superset_embeddings[mask])
+        invalidate(model_path)
+        yield label, superset_df[mask], topics[mask], window_info
+
+def compute_topics_incremental(user_email: str, progress=lambda stage: None):
+    """
+    Incrementally generate topic models based on timeframes:
+      - For 3 months or more (3 months, 6 months, 1 year, 3 years): run the BERTopic model.
+      - For 1 month: simply filter the first month of emails without topic modeling.
+    
+    The models for 3+ month windows are saved separately. With TOPIC_INCREMENTAL_MODE=hierarchical
+    only the longest window is fit and the shorter ones reuse its topics (see _hierarchical_windows).
+    The job returns the filtered one-month emails and the modeled topics from the 3-month window.
+    """
+    progress("fetching")
+    emails = fetch_user_emails(user_email)
+    observe_documents(len(emails["email_id"]))
+    if len(emails["email_id"]) == 0:
+        raise HTTPException(status_code=404, detail="No emails found for this user.")
+
+    # Wrap the fetched columns without copying; date_sent is already datetime64
+    email_df = pd.DataFrame(emails, copy=False)
+
+    now = pd.Timestamp.now()
+
+    # --- One-month: just filter the first month of conversations (no model run) ---
+    one_month_df = email_df[email_df["date_sent"] >= (now - pd.Timedelta(days=30))]
+    # You might choose to simply label these emails with a default topic,
+    # or leave them unmodeled. Here we assign a placeholder topic.
+    one_month_df = one_month_df.copy()
+    one_month_df["group_id"] = -99  # a marker for "no modeling"
+    one_month_df["topic_name"] = "Not Modeled (1 Month Only)"
+    
+    output_results = {}
+
+    # The windows are nested, so embed the longest one once and slice it per window
+    longest_days = max(days for _, days in MODEL_TIME_WINDOWS)
+    superset_df = email_df[email_df["date_sent"] >= (now - pd.Timedelta(days=longest_days))]
+    progress("embedding")
+    superset_embeddings, embedding_model_name, missing = load_embeddings(
+        user_email,
+        superset_df["email_id"].tolist(),
+        superset_df["email_text"].tolist()
+    )
+    # Emails left without a stored vector are fitted in no window and stored as its outliers
+    unembedded_df = superset_df[missing]
+    superset_df = superset_df[~missing]
+    window_days = dict(MODEL_TIME_WINDOWS)
+
+    progress("clustering")
+    fit_windows = _hierarchical_windows if INCREMENTAL_MODE == "hierarchical" else _independent_windows
+    for label, window_df, topics, topic_info in fit_windows(user_email, superset_df, superset_embeddings, embedding_model_name, now):
+        progress(f"storing {label}")
+        model_path = artifact_path(user_email, label)
+        window_df = window_df.copy()
+        window_df["group_id"], window_df["topic_name"] = label_topics(topics, topic_info)
+        if len(unembedded_df):
+            left_out = unembedded_df[_window_mask(unembedded_df, now, window_days[label])].copy()
+            left_out["group_id"], left_out["topic_name"] = label_topics(np.full(len(left_out), -1), topic_info)
+            window_df = pd.concat([window_df, left_out]).sort_values(by="date_sent", ascending=False)
+
+        # Save the topics to the database for this window
+        store_topics_in_db(user_email, window_df)
+
+        # For output purposes, let's return the 3_months model data only
+        if label == "3_months":
+            output_results[label] = {
+                "model_file": model_path,
+                "topics": topic_table(topic_info),
+                "email_topics": window_df[["email_id", "group_id", "topic_name"]].reset_index(drop=True)
+            }
+
+    # Add the one-month filtered (non-modeled) results to the output
+    output_results["1_month"] = {
+        "filtered_emails": one_month_df[["email_id", "topic_name", "date_sent"]].reset_index(drop=True)
+    }
+
+    return output_results
+
+def compute_update_topics(user_email: str, new_documents: List[str], progress=lambda stage: None):
+    """
+    Update the topic model with additional documents.
+    New documents are folded into the saved artifact (nearest-centroid assignment plus
+    incremental centroid and c-TF-IDF updates), so the cost is O(new documents).
+    The whole mailbox is refit only when there is no usable artifact yet, or when the
+    outlier rate or growth since the last fit crosses its threshold; the new documents
+    are fitted with it. Either way "topics" has one row per new document.
+    """
+    model_path = artifact_path(user_email)
+    artifact = None
+    if artifact_exists(model_path):
+        try:
+            artifact = load_topic_artifact(model_path)
+        except Exception as e:
+            logger.warning("Error loading model %s: %s", model_path, e)
+
+    # New documents have no stored vectors, so they are embedded locally and can
+    # only be folded into an artifact fitted in the local model's space
+    if artifact is None or artifact["embedding_model"] != EMBEDDING_MODEL_NAME:
+        result = compute_topics(user_email, refit=True, progress=progress, extra_documents=new_documents)
+        return {"message": "BERTopic model refit successfully", "mode": "refit", "topics": result["new_topics"]}
+
+    progress("embedding")
+    observe_documents(len(new_documents))
+    with stage("embed"):
+        embeddings = get_embedding_model().encode(new_documents, show_progress_bar=False).astype(np.float32)
+
+    progress("assigning")
+    with stage("update_artifact"):
+        topics_array = update_artifact(model_path, artifact, embeddings, new_documents, UPDATE_MIN_SIMILARITY)
+    invalidate(model_path)
+    artifact = load_topic_artifact(model_path)
+
+    manifest = artifact["manifest"]
+    outlier_rate = manifest["outliers_since_fit"] / max(manifest["docs_since_fit"], 1)
+    growth = manifest["docs_since_fit"] / max(manifest["fit_doc_count"], 1)
+    if (manifest["docs_since_fit"] >= UPDATE_MIN_DOCS and outlier_rate > UPDATE_MAX_OUTLIER_RATE) or growth > UPDATE_MAX_GROWTH:
+        logger.info("Refitting topics for %s: outlier rate %.2f, growth %.2f", user_email, outlier_rate, growth)
+        result = compute_topics(user_email, refit=True, progress=progress, extra_documents=new_documents)
+        return {"message": "BERTopic model refit successfully", "mode": "refit", "topics": result["new_topics"]}
+
+    # Prepare topics info
+    group_ids, topic_names = label_topics(topics_array, artifact["topic_info"])
+    email_df = pd.DataFrame({
+         "email_id": [None] * len(new_documents),
+         "group_id": group_ids,
+         "topic_name": topic_names
+    })
+    
+    # The new documents have no email ids, so this only refreshes the touched topics' names (and moved centroids)
+    progress("storing")
+    store_topics_in_db(user_email, email_df, centroids=topic_centroids(artifact))
+    
+    return {"message": "BERTopic model updated successfully", "mode": "incremental", "topics": email_df}
+
+def compute_assign_topics(user_email: str, documents: List[str]) -> List[dict]:
+    """
+    Label new emails with the user's nearest stored topic centroid.
+    Only the shared embedding model is used; the user's topic model is never loaded,
+    and the lookup is one query against the TopicCentroids HNSW index.
+    Emails no centroid reaches UPDATE_MIN_SIMILARITY for are labeled as outliers.
+    The texts can only be embedded with the local model, so centroids stored in another
+    model's space (EMBEDDING_SOURCE=stored) are refused with 409.
+    """
+    observe_documents(len(documents))
+    conn = get_db_connection()
+    try:
+        model_name = centroid_model(conn.cursor(), user_email)
+        conn.commit()
+        if model_name is None:
+            raise HTTPException(status_code=404, detail="No topic centroids for this user, run /topics first.")
+        if model_name != EMBEDDING_MODEL_NAME:
+            raise HTTPException(
+                status_code=409,
+                detail=f"This user's topics were fitted on {model_name} vectors, but /assign_topics embeds texts with "
+                       f"{EMBEDDING_MODEL_NAME}; the two models' vectors can't be compared."
+            )
+        with stage("embed"):
+            embeddings = get_embedding_model().encode(documents, show_progress_bar=False).astype(np.float32)
+        with stage("nearest_topics"):
+            nearest = nearest_topics(conn.cursor(), user_email, model_name, embeddings)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        release_db_connection(conn)
+
+    # The centroids can be gone by the time of the lookup
+    if nearest and nearest[0] is None:
+        raise HTTPException(status_code=404, detail="No topic centroids for this user, run /topics first.")
+
+    assignments = []
+    for group_id, name, distance in nearest:
+        similarity = 1 - distance
+        if similarity < UPDATE_MIN_SIMILARITY:
+            assignments.append({"group_id": -1, "topic_name": "Outlier", "similarity": similarity})
+        else:
+            assignments.append({"group_id": group_id, "topic_name": name or f"Topic {group_id}", "similarity": similarity})
+    return assignments
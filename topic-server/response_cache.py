@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+import pandas as pd
+from fastapi import Request, Response
+
+from formats import render
+
+# Upper bound on the /topics and /topics_incremental results kept in memory, in bytes
+# (the result tables plus every format they have been rendered in)
+RESPONSE_CACHE_BYTES = int(os.environ.get("TOPIC_RESPONSE_CACHE_BYTES", 256 * 1024 ** 2))
+# Seconds a result is served from the cache. Entries are keyed on a cheap mailbox summary
+# that misses edits to existing emails; once this expires, a job runs the full watermark check.
+RESPONSE_CACHE_TTL = int(os.environ.get("TOPIC_RESPONSE_CACHE_TTL", 600))
+
+# (user_email, endpoint, version) -> {"result", "size", "expires_at", "bodies": media type -> (etag, body)}
+_responses: "OrderedDict[Hashable, dict]" = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _result_bytes(value) -> int:
+    """Rough in-memory size of a result: its tables, plus a little for everything else."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sum(_result_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_result_bytes(item) for item in value)
+    return 64
+
+def _evict(key: Hashable):
+    global _total_bytes
+    _total_bytes -= _responses.pop(key)["size"]
+
+def _make_room(size: int):
+    while _responses and _total_bytes + size > RESPONSE_CACHE_BYTES:
+        _evict(next(iter(_responses)))
+        stats["evictions"] += 1
+
+def put_result(key: Hashable, result):
+    """
+    Cache a finished result, evicting least recently used entries over RESPONSE_CACHE_BYTES.
+    It is rendered per format on first request. Keys start with the user's email so
+    invalidate_user can find them.
+    """
+    global _total_bytes
+    size = _result_bytes(result)
+    with _lock:
+        if key in _responses:
+            _evict(key)
+        if size > RESPONSE_CACHE_BYTES:
+            return
+        _make_room(size)
+        _responses[key] = {"result": result, "size": size, "expires_at": time.monotonic() + RESPONSE_CACHE_TTL, "bodies": {}}
+        _total_bytes += size
+
+def get_response(key: Hashable, media_type: str) -> Optional[Tuple[str, bytes]]:
+    """
+    The cached (etag, body) for key in media_type, or None (also once the entry is older
+    than RESPONSE_CACHE_TTL). A format requested for the
+    first time is rendered once and kept; its strong ETag is the hash of that body.
+    """
+    global _total_bytes
+    with _lock:
+        entry = _responses.get(key)
+        if entry is not None and entry["expires_at"] < time.monotonic():
+            _evict(key)
+            entry = None
+        if entry is None:
+            stats["misses"] += 1
+            return None
+        _responses.move_to_end(key)
+        stats["hits"] += 1
+        rendered = entry["bodies"].get(media_type)
+    if rendered is not None:
+        return rendered
+
+    body = render(entry["result"], media_type)
+    rendered = ('"' + hashlib.sha256(body).hexdigest() + '"', body)
+    with _lock:
+        if _responses.get(key) is entry and media_type not in entry["bodies"]:
+            entry["bodies"][media_type] = rendered
+            entry["size"] += len(body)
+            _total_bytes += len(body)
+            # Keep this entry while making room; it was just used
+            _responses.move_to_end(key)
+            while len(_responses) > 1 and _total_bytes > RESPONSE_CACHE_BYTES:
+                _evict(next(iter(_responses)))
+                stats["evictions"] += 1
+    return rendered
+
+def invalidate_user(user_email: str):
+    """Drop every cached response for a user, e.g. once new assignments are committed."""
+    with _lock:
+        for key in [key for key in _responses if key[0] == user_email]:
+            _evict(key)
+
+def etag_response(request: Request, etag: str, body: bytes, media_type: str) -> Response:
+    """The cached body, or an empty 304 if the client already holds this ETag."""
+    headers = {"ETag": etag, "Vary": "Accept"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Large-mailbox mode for /topics: with more emails than this (after near-duplicate
+# collapsing) the model is fit on a stratified sample of this size, and the rest are
+# assigned to its topics in batches. 0 always fits on every email.
+FIT_SAMPLE_CAP = int(os.environ.get("TOPIC_FIT_SAMPLE_CAP", 20000))
+# Emails embedded and assigned at a time, so memory stays flat however large the mailbox
+ASSIGN_BATCH_SIZE = int(os.environ.get("TOPIC_ASSIGN_BATCH_SIZE", 5000))
+
+def stratified_sample(dates_sent: np.ndarray, senders: np.ndarray, cap: int = FIT_SAMPLE_CAP, seed: int = 42) -> np.ndarray:
+    """
+    Sorted indices of up to cap emails, spread over (month sent, sender) strata in
+    proportion to their size: emails are ordered by stratum (shuffled within each one)
+    and every (n / cap)-th is taken. All indices if there are no more than cap emails.
+    """
+    n = len(dates_sent)
+    if cap <= 0 or n <= cap:
+        return np.arange(n)
+    months = np.asarray(dates_sent, dtype="datetime64[M]").view(np.int64)
+    senders, _ = pd.factorize(pd.Series(senders, dtype=object))
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(n), senders, months))
+    step = n / cap
+    positions = (np.arange(cap) * step + rng.random() * step).astype(np.int64)
+    return np.sort(order[np.minimum(positions, n - 1)])
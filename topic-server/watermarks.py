@@ -0,0 +1,91 @@
+from typing import List, Optional, Tuple
+
+# Per-user mailbox watermarks: a cheap fingerprint of what /topics last modeled,
+# so an unchanged mailbox can be answered from Groups/GroupEmail without refitting.
+
+def read_mailbox_watermark(cur, user_email: str) -> dict:
+    """
+    Fingerprint a user's mailbox as it is now: email count, latest date_sent and an
+    order-independent hash of every email_id with the subject and summary that the
+    topics are built from. The hash is a sum of per-row md5 prefixes, so Postgres
+    computes it in one pass over the user's rows without sorting them.
+    """
+    cur.execute(
+        """
+        SELECT count(*),
+               max(date_sent),
+               coalesce(sum(('x' || left(md5(email_id || E'\\x1f' || coalesce(subj, '') || E'\\x1f' || coalesce(summary, '')), 16))::bit(64)::bigint), 0)::text
+        FROM Emails
+        WHERE user_email_address = %s
+        """,
+        (user_email,)
+    )
+    email_count, max_date_sent, content_hash = cur.fetchone()
+    return {"email_count": email_count, "max_date_sent": max_date_sent, "content_hash": content_hash}
+
+def read_mailbox_summary(cur, user_email: str) -> dict:
+    """
+    Email count and latest date_sent of a user's mailbox: an index-only scan of
+    emails_user_date_idx, cheap enough to run on every cache lookup. Unlike the
+    watermark it doesn't notice edits to existing emails.
+    """
+    cur.execute(
+        "SELECT count(*), max(date_sent) FROM Emails WHERE user_email_address = %s",
+        (user_email,)
+    )
+    email_count, max_date_sent = cur.fetchone()
+    return {"email_count": email_count, "max_date_sent": max_date_sent}
+
+def load_watermark(cur, user_email: str) -> Optional[dict]:
+    """The watermark saved by the last /topics run for this user, if any."""
+    cur.execute(
+        """
+        SELECT email_count, max_date_sent, content_hash, model_version
+        FROM MailboxWatermarks
+        WHERE user_email_address = %s
+        """,
+        (user_email,)
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {"email_count": row[0], "max_date_sent": row[1], "content_hash": row[2], "model_version": row[3]}
+
+def save_watermark(cur, user_email: str, watermark: dict):
+    """Record the watermark (including model_version) the stored assignments were computed for."""
+    cur.execute(
+        """
+        INSERT INTO MailboxWatermarks (user_email_address, email_count, max_date_sent, content_hash, model_version, updated_at)
+        VALUES (%s, %s, %s, %s, %s, now())
+        ON CONFLICT (user_email_address) DO UPDATE
+        SET email_count = EXCLUDED.email_count,
+            max_date_sent = EXCLUDED.max_date_sent,
+            content_hash = EXCLUDED.content_hash,
+            model_version = EXCLUDED.model_version,
+            updated_at = EXCLUDED.updated_at
+        """,
+        (user_email, watermark["email_count"], watermark["max_date_sent"], watermark["content_hash"], watermark["model_version"])
+    )
+
+def clear_watermark(cur, user_email: str):
+    """Forget the watermark, e.g. after assignments were stored by something other than /topics."""
+    cur.execute("DELETE FROM MailboxWatermarks WHERE user_email_address = %s", (user_email,))
+
+def fetch_stored_assignments(cur, user_email: str) -> List[Tuple[str, int, str]]:
+    """
+    (email_id, group_id, topic name) for every model-written assignment of the user's
+    current emails, newest email first. Emails the frontend added to groups are not included.
+    """
+    cur.execute(
+        """
+        SELECT ge.email_id, ge.group_id, g.name
+        FROM GroupEmail ge
+        JOIN Groups g ON g.user_email_address = ge.user_email_address AND g.group_id = ge.group_id
+        JOIN Emails e ON e.email_id = ge.email_id AND e.user_email_address = ge.user_email_address
+        WHERE ge.user_email_address = %s
+          AND ge.origin = 'model'
+        ORDER BY e.date_sent DESC NULLS LAST, ge.email_id DESC
+        """,
+        (user_email,)
+    )
+    return cur.fetchall()
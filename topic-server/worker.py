@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import APIRouter, Body, FastAPI, HTTPException, Query, Request, Response
+
+from compute import limit_process_threads
+from formats import negotiate, render
+from jobs import JOB_THREADS, get_job, job_summary, request_allotment, submit_job
+from metrics import TRACE_HEADER, server_timing, trace_requests
+from metrics import router as metrics_router
+from pipeline import (
+    compute_assign_topics,
+    compute_topics,
+    compute_topics_incremental,
+    compute_update_topics,
+    mailbox_summary,
+    preload_modeling,
+    response_version
+)
+from response_cache import etag_response, get_response, put_result
+
+# Level of the modeling pipeline's log messages; timings and counts are exported at /metrics
+LOG_LEVEL = os.environ.get("TOPIC_LOG_LEVEL", "INFO")
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Modeling endpoints. Jobs run in this process, so /jobs is served here too.
+router = APIRouter()
+
+def cached_job(endpoint: str, fn):
+    """
+    Wrap a job function so its result is cached under the version of the mailbox and
+    model it was computed from. The mailbox is summarized before the run, so mail arriving
+    mid-run leaves the entry unreachable rather than wrong.
+    """
+    def run(user_email: str, progress):
+        mailbox = mailbox_summary(user_email)
+        result = fn(user_email, progress=progress)
+        put_result((user_email, endpoint, response_version(user_email, endpoint, mailbox)), result)
+        return result
+    return run
+
+def cached_or_submit(request: Request, endpoint: str, user_email: str, fn):
+    """
+    Answer from the response cache in the negotiated format (200, or 304 on a matching
+    If-None-Match), or queue a job (202).
+    """
+    media_type = negotiate(request)
+    key = (user_email, endpoint, response_version(user_email, endpoint, mailbox_summary(user_email)))
+    cached = get_response(key, media_type)
+    if cached is not None:
+        return etag_response(request, *cached, media_type)
+    return job_summary(submit_job(endpoint, user_email, cached_job(endpoint, fn), user_email))
+
+@router.get("/topics", status_code=202)
+def get_topics(request: Request, user_email: str = Query(..., description="User's email address")):
+    """
+    Queue a clustering job for the user's mailbox; poll /jobs/{job_id} for the result.
+    If the mailbox and model are unchanged since the last run, the cached result is returned directly.
+    """
+    return cached_or_submit(request, "topics", user_email, compute_topics)
+
+@router.get("/topics_incremental", status_code=202)
+def get_topics_incremental(request: Request, user_email: str = Query(..., description="User's email address")):
+    """
+    Queue the per-timeframe clustering job; poll /jobs/{job_id} for the result.
+    If the mailbox and models are unchanged since the last run today, the cached result is returned directly.
+    """
+    return cached_or_submit(request, "topics_incremental", user_email, compute_topics_incremental)
+
+@router.post("/update_topics", status_code=202)
+def update_topics(
+    user_email: str = Query(..., description="User's email address"),
+    new_documents: List[str] = Body(..., description="List of new email texts")
+):
+    """Queue a model update with additional documents; poll /jobs/{job_id} for the result."""
+    # Only identical updates coalesce; different documents for the same user queue behind each other
+    key = ("update_topics", user_email, hashlib.sha256("\0".join(new_documents).encode("utf-8")).hexdigest())
+    return job_summary(submit_job("update_topics", user_email, compute_update_topics, user_email, new_documents, key=key))
+
+@router.post("/assign_topics")
+def assign_topics(
+    user_email: str = Query(..., description="User's email address"),
+    documents: List[str] = Body(..., description="Texts (subject and summary) of the emails to label")
+):
+    """Label new emails with their nearest stored topic, without loading the user's topic model."""
+    if not documents:
+        return []
+    # Embeds on this request thread, so it runs in the allotment kept for requests
+    with request_allotment():
+        return compute_assign_topics(user_email, documents)
+
+@router.get("/jobs/{job_id}")
+def get_job_status(job_id: str, request: Request):
+    """
+    Report a clustering job's status, progress and, once finished, its result or error,
+    in the format negotiated from the Accept header.
+    With the X-Topic-Trace header, a finished job's stage timings come back in Server-Timing.
+    """
+    media_type = negotiate(request)
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    headers = {"Vary": "Accept"}
+    if TRACE_HEADER.lower() in request.headers and job["trace"] is not None:
+        headers["Server-Timing"] = server_timing(job["trace"], job["finished_at"] - job["started_at"])
+    body = render({**job_summary(job), "result": job["result"]}, media_type)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pay for the ML imports and the embedding model once, before taking traffic
+    preload_modeling()
+    # torch and BLAS share one thread pool per process: size it for a single job,
+    # so the JOB_WORKERS jobs and /assign_topics together stay within the core budget
+    limit_process_threads(JOB_THREADS)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(trace_requests)
+app.include_router(router)
+app.include_router(metrics_router)